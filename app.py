@@ -1,4 +1,8 @@
-from flask import Flask, jsonify, abort, make_response, request
+import csv
+import io
+import sys
+from flask import Flask, Response, jsonify, abort, make_response, \
+    request, stream_with_context
 
 # For manual checking of user without wrapping,
 # we need to use protected member from Flask-JWT :/
@@ -6,14 +10,31 @@ from flask_jwt import JWT, jwt_required, current_identity, _jwt_required
 from flask_cors import CORS, cross_origin
 from werkzeug.utils import secure_filename
 from modules.database import *
-from modules.utils import update_config, get_json, get_secret, User, \
-    check_extension
+from modules import encoding
+from modules.compression import codings, compress
+from modules.utils import update_config, get_secret, User, \
+    check_extension, template_fields, flatten_value
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = get_secret()
 app.config['JWT_EXPIRATION_DELTA'] = datetime.timedelta(hours=3)
 app.config['UPLOAD_FOLDER'] = config['media_root']
 cors = CORS(app, supports_credentials=True)
+encoding.install(app, config.get('encoding', {}))
+
+# Default and maximum number of items in one page.
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Maximum number of sub-requests in one batch.
+MAX_BATCH_SIZE = 20
+
+# Maximum number of participants in one import.
+MAX_IMPORT_SIZE = 5000
+
+# Columns of participant export before fields of form.
+EXPORT_COLUMNS = ['participation_id', 'id', 'name', 'email', 'signed',
+                  'role', 'paid', 'waitlisted']
 
 
 def unauthorized():
@@ -24,6 +45,251 @@ def unauthorized():
     return make_response(jsonify({'error': 'Unauthorized access'}), 401)
 
 
+def conditional(version, build):
+    """
+    Answer conditional GET with 304 if client already has given version,
+    otherwise build the response and tag it with version.
+    :param version:
+    :param build:
+    :return:
+    """
+    if version is None:
+        return build()
+
+    etag = version['etag']
+    changed = version['changed']
+    if changed is not None:
+        changed = changed.replace(microsecond=0,
+                                  tzinfo=datetime.timezone.utc)
+
+    # Tag is more precise than time, so time is only used without tag
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and changed is not None:
+        since = request.if_modified_since
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        fresh = changed <= since
+    else:
+        fresh = False
+
+    # 304 has to repeat the tag 200 would have. Body may be compressed
+    # for this client, and then it is not byte for byte the same.
+    weak = accepted_coding() is not None
+
+    if fresh:
+        response = make_response('', 304)
+    else:
+        response = build()
+
+    response.set_etag(etag, weak=weak)
+    if weak:
+        response.vary.add('Accept-Encoding')
+    if changed is not None:
+        response.last_modified = changed
+
+    # Clients may keep responses but have to check them every time
+    response.cache_control.no_cache = True
+
+    return response
+
+
+def cached(name, tags, build, version=None):
+    """
+    Get public GET response from shared cache or build and store it.
+    Entries are dropped when data layer invalidates any of tags, and
+    responses built before that are not stored. With version, entries
+    of older versions are never used either.
+    :param name:
+    :param tags:
+    :param build:
+    :param version:
+    :return:
+    """
+    if responses is None:
+        return build()
+
+    key = name + ":" + request.path + "?" + "&".join(
+        key + "=" + value for key, value in sorted(
+            request.args.items(multi=True)))
+    if version is not None:
+        key += "#" + version['etag']
+
+    ttl = config.get('responses', {}).get('ttl', {}).get(name)
+    coding = accepted_coding()
+    generation = responses.generation(tags)
+
+    data = responses.get(key)
+    if data is not None:
+        response = app.response_class(data, mimetype='application/json')
+    else:
+        response = build()
+        if response.status_code != 200 or \
+                not cacheable(response.get_json()):
+            return response
+
+        data = response.get_data()
+        responses.set(key, data, tags, ttl, generation)
+
+    # Compressed body is cached next to the plain one, so it is
+    # compressed only once
+    if coding is not None and len(data) >= compression_threshold():
+        compressed = responses.get(key + "|" + coding)
+        if compressed is None:
+            compressed = compress(data, coding, config.get('compression', {}))
+            responses.set(key + "|" + coding, compressed, tags, ttl,
+                          generation)
+
+        encode_body(response, compressed, coding)
+
+    return response
+
+
+def cacheable(body):
+    """
+    Check that body is worth sharing, not missing or an error that
+    could be fixed by the next write.
+    :param body:
+    :return:
+    """
+    if body is None:
+        return False
+    elif isinstance(body, dict):
+        if 'Error' in body:
+            return False
+
+        # Bodies like {"event": null}
+        if len(body) == 1:
+            return cacheable(next(iter(body.values())))
+
+    return True
+
+
+def compression_threshold():
+    """
+    Get size in bytes from which responses are compressed.
+    :return:
+    """
+    return int(config.get('compression', {}).get('threshold', 1024))
+
+
+def accepted_coding():
+    """
+    Get content coding to compress response with, None if client
+    doesn't accept any.
+    :return:
+    """
+    return request.accept_encodings.best_match(codings())
+
+
+def encode_body(response, data, coding):
+    """
+    Replace body of response with one compressed with coding.
+    :param response:
+    :param data:
+    :param coding:
+    :return:
+    """
+    response.set_data(data)
+    response.headers['Content-Encoding'] = coding
+    response.vary.add('Accept-Encoding')
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress large enough responses if client accepts it.
+    :param response:
+    :return:
+    """
+    if 'Content-Encoding' not in response.headers and \
+            response.status_code == 200 and \
+            not response.direct_passthrough and \
+            not response.is_streamed and \
+            (response.mimetype == 'application/json' or
+             response.mimetype.startswith('text/')):
+        coding = accepted_coding()
+        data = response.get_data()
+        if coding is not None and len(data) >= compression_threshold():
+            encode_body(response, compress(data, coding,
+                                           config.get('compression', {})),
+                        coding)
+
+    # Compressed body is not byte for byte the same as the plain one
+    etag, weak = response.get_etag()
+    if etag is not None and not weak and \
+            'Content-Encoding' in response.headers:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def paginated(name, key, fetch):
+    """
+    Get one page of items from fetch(limit, after) with cursor of next
+    page, if request has limit or after. Otherwise get all of them.
+    :param name:
+    :param key:
+    :param fetch:
+    :return:
+    """
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+
+    # Invalid values must not fall back to the whole list
+    if (limit is None and 'limit' in request.args) or \
+            (after is None and 'after' in request.args):
+        abort(400)
+
+    if limit is None and after is None:
+        return fetch(None, 0)
+
+    limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+
+    # One extra item tells if there is a next page
+    items = fetch(limit + 1, after or 0)
+    if items is None:
+        return {'Error': 'Unable to get ' + name + '.'}
+
+    if len(items) > limit:
+        items = items[:limit]
+        cursor = items[-1][key]
+    else:
+        cursor = None
+
+    return {name: items, 'next': cursor}
+
+
+def event_options():
+    """
+    Get fields and expand parameters of request for events as sets,
+    None if not given. Unknown names are rejected.
+    :return:
+    """
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = set(field for field in fields.split(",") if field)
+        if not fields <= set(EVENT_FIELDS):
+            abort(400)
+
+    expand = request.args.get('expand')
+    if expand is not None:
+        expand = set(name for name in expand.split(",") if name)
+        if not expand <= set(EVENT_EXPANSIONS):
+            abort(400)
+
+    return fields, expand
+
+
+def event_tags(event_id):
+    """
+    Get cache tags of event with event_id.
+    :param event_id:
+    :return:
+    """
+    return ['event', 'event:' + str(event_id)]
+
+
 def authenticate(username, password):
     """
     Authenticate user if exists.
@@ -45,7 +311,7 @@ def identity(payload):
     """
     user_id = payload['identity']
 
-    return get_user(user_id, True)
+    return get_identity(user_id)
 
 
 jwt = JWT(app, authenticate, identity)
@@ -108,9 +374,10 @@ def all_users():
     Get all users
     :return:
     """
-    users = get_users()
+    users = paginated('users', 'id', get_users)
 
-    for user in users:
+    page = users.get('users', []) if isinstance(users, dict) else users
+    for user in page:
         del user['password']
 
     return jsonify(users)
@@ -168,7 +435,21 @@ def event(event_id):
     :param event_id:
     :return:
     """
-    return jsonify({'event': get_event(event_id, False)})
+    fields, expand = event_options()
+
+    def build():
+        return jsonify({'event': get_event(event_id, False, fields=fields,
+                                           expand=expand)})
+
+    version = get_event_version(event_id)
+
+    # Participants need authorization and are never shared
+    if expand is not None and 'participants' in expand:
+        _jwt_required(app.config['JWT_DEFAULT_REALM'])
+        return conditional(version, build)
+
+    return conditional(version, lambda: cached(
+        'event', event_tags(event_id), build, version))
 
 
 @app.route('/v1.0/events/', methods=['GET', 'POST'])
@@ -182,15 +463,43 @@ def events():
 
     # Check request method
     if request.method == "GET":
-        if event_id is not None:
-
-            # Getting participants with event need authorization
-            if request.args.get('participants') == "true":
-                _jwt_required(app.config['JWT_DEFAULT_REALM'])
-
-            return jsonify(get_event(event_id, current_identity is not None))
+        fields, expand = event_options()
+        participants = request.args.get('participants') == "true"
+        if expand is not None and participants:
+            expand.add('participants')
+        elif expand is not None and 'participants' in expand:
+            participants = True
+
+        # Lists expand nothing by default, so without expand the flag
+        # doesn't add participants to them
+        if event_id is None and expand is None:
+            participants = False
+
+        # Getting participants with event need authorization
+        if participants:
+            _jwt_required(app.config['JWT_DEFAULT_REALM'])
 
-        return jsonify(get_events())
+        if event_id is not None:
+            version = get_event_version(event_id)
+            if version is not None and participants:
+                version['etag'] += "-participants"
+
+            # Participants only when asked for and authorized above
+            return conditional(version, lambda: jsonify(
+                get_event(event_id, participants, fields=fields,
+                          expand=expand)))
+
+        def build():
+            return jsonify(paginated(
+                'events', 'id', lambda limit, after: get_events(
+                    limit, after, fields, expand or ())))
+
+        version = get_events_version()
+        if participants:
+            return conditional(version, build)
+
+        return conditional(version, lambda: cached(
+            'events', ['events'], build, version))
     else:
         # All POST request for events need authorization
         _jwt_required(app.config['JWT_DEFAULT_REALM'])
@@ -230,7 +539,7 @@ def events():
                     name = request.json['name']
 
                 if 'template' not in request.json:
-                    template = get_json(old_event['template'])
+                    template = old_event['template']
                 else:
                     template = request.json['template']
 
@@ -279,7 +588,7 @@ def edit_event(event_id):
         name = request.json['name']
 
     if 'template' not in request.json:
-        template = get_json(old_event['template'])
+        template = old_event['template']
     else:
         template = request.json['template']
 
@@ -289,7 +598,7 @@ def edit_event(event_id):
         expire = request.json['expire']
 
     if 'description' not in request.json:
-        description = get_txt(old_event['description'])
+        description = old_event['description']
     else:
         description = request.json['description']
 
@@ -336,6 +645,74 @@ def newest_event():
     return jsonify({'newest': get_newest(tables['events'])})
 
 
+@app.route('/v1.0/stats/cache/', methods=['GET'])
+@jwt_required()
+def stats_cache():
+    """
+    Get hits and misses of caches of the worker answering.
+    :return:
+    """
+    return jsonify({'pid': os.getpid(), 'caches': cache_stats()})
+
+
+@app.route('/v1.0/batch', methods=['POST'])
+@cross_origin()
+def batch():
+    """
+    Run several requests against other routes in one round-trip.
+    Body is a list of {"method": ..., "path": ..., "body": ...} and
+    results come back in the same order. Sub-requests share one database
+    connection and rows they have already loaded.
+    :return:
+    """
+    if not isinstance(request.json, list) or \
+            len(request.json) > MAX_BATCH_SIZE:
+        abort(400)
+
+    # Sub-requests are made with the same authorization
+    headers = {}
+    if 'Authorization' in request.headers:
+        headers['Authorization'] = request.headers['Authorization']
+
+    with request_scope():
+        results = [dispatch(sub_request, headers)
+                   for sub_request in request.json]
+
+    return jsonify(results)
+
+
+def dispatch(sub_request, headers):
+    """
+    Run one sub-request of batch in-process.
+    :param sub_request:
+    :param headers:
+    :return:
+    """
+    if not isinstance(sub_request, dict) or \
+            not isinstance(sub_request.get('path'), str) or \
+            not sub_request['path'].startswith("/v1.0/") or \
+            sub_request['path'].startswith("/v1.0/batch"):
+        return {'status': 400, 'body': {'Error': 'Invalid sub-request.'}}
+
+    method = str(sub_request.get('method', "GET")).upper()
+    with app.test_request_context(sub_request['path'], method=method,
+                                  headers=headers,
+                                  json=sub_request.get('body')):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            app.log_exception(sys.exc_info())
+            return {'status': 500, 'body': {'Error': 'Internal error.'}}
+
+        # Streamed bodies need context of their request
+        if response.is_json:
+            body = response.get_json()
+        else:
+            body = response.get_data(as_text=True)
+
+    return {'status': response.status_code, 'body': body}
+
+
 @app.route('/v1.0/humans/', methods=['GET'])
 @jwt_required()
 @cross_origin()
@@ -433,7 +810,10 @@ def param_participants():
 
         # Get participants if event_id is provided
         if event_id is not None:
-            return jsonify(get_participants(event_id, True))
+            return jsonify(paginated(
+                'participants', 'participation_id',
+                lambda limit, after: get_participants(event_id, True, limit,
+                                                      after)))
         else:
             abort(400)
 
@@ -452,6 +832,99 @@ def participant_add(event_id):
                                                     request.json['form'])})
 
 
+@app.route('/v1.0/event/<int:event_id>/participants/bulk', methods=['POST'])
+@jwt_required()
+def participants_bulk(event_id):
+    """
+    Add many participants to event at once, from a JSON list of forms
+    or a CSV with a column for each field of form.
+    :param event_id:
+    :return:
+    """
+    if request.mimetype == "text/csv":
+        reader = csv.DictReader(io.StringIO(request.get_data(as_text=True)))
+        forms = [{key.strip(): value for key, value in row.items()
+                  if key is not None} for row in reader]
+    elif isinstance(request.json, list):
+        forms = request.json
+    else:
+        abort(400)
+
+    if len(forms) > MAX_IMPORT_SIZE:
+        abort(400)
+
+    return jsonify({'participants': add_participants_bulk(event_id, forms)})
+
+
+@app.route('/v1.0/event/<int:event_id>/participants/export',
+           methods=['GET'])
+@jwt_required()
+def participants_export(event_id):
+    """
+    Stream participants of event with their forms as NDJSON or CSV,
+    one row at a time. Forms are flattened to columns by event template.
+    :param event_id:
+    :return:
+    """
+    export_format = request.args.get('format', "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        abort(400)
+
+    event = get_event(event_id, fields={'name'}, expand={'template'})
+    if event is None:
+        abort(404)
+
+    # Without known fields whole form is kept in one column
+    fields = template_fields(event['template'])
+    columns = EXPORT_COLUMNS + ["form." + field for field in fields]
+    if len(fields) == 0:
+        columns.append("form")
+
+    def rows():
+        for participant in stream_participants(event_id, True):
+            form = participant.pop('form')
+            if participant['role'] is not None:
+                participant['role'] = participant['role']['name']
+            if len(fields) == 0:
+                participant['form'] = form
+            for field in fields:
+                participant["form." + field] = form.get(field) \
+                    if isinstance(form, dict) else None
+            yield participant
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+
+        # Header is sent before the first batch is read
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+        for row in rows():
+            writer.writerow([flatten_value(row[column])
+                             for column in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    def generate_ndjson():
+        for row in rows():
+            yield encoding.dumps(row, dates="iso") + b"\n"
+
+    if export_format == "csv":
+        response = Response(stream_with_context(generate_csv()),
+                            mimetype="text/csv")
+        response.headers['Content-Disposition'] = \
+            'attachment; filename="participants_{0}.csv"'.format(event_id)
+    else:
+        response = Response(stream_with_context(generate_ndjson()),
+                            mimetype="application/x-ndjson")
+
+    return response
+
+
 @app.route('/v1.0/participant/<int:participation_id>/payment/<int:status>',
            methods=['POST'])
 @jwt_required()
@@ -520,9 +993,11 @@ def params_roles():
 
         # Return role if role_id is provided, otherwise return all roles
         if role_id is not None:
-            return jsonify(get_role(role_id))
+            return cached('roles', ['roles'],
+                          lambda: jsonify(get_role(role_id, True)))
         else:
-            return jsonify(get_roles())
+            return cached('roles', ['roles'],
+                          lambda: jsonify(get_roles(True)))
 
 
 @app.route('/v1.0/role/<int:role_id>/', methods=['GET'])
@@ -532,7 +1007,8 @@ def role(role_id):
     :param role_id:
     :return:
     """
-    return jsonify({'role': get_role(role_id)})
+    return cached('role', ['roles'],
+                  lambda: jsonify({'role': get_role(role_id, True)}))
 
 
 @app.route('/v1.0/roles/create/', methods=['POST'])
@@ -635,7 +1111,10 @@ def prices(event_id):
     :param event_id:
     :return:
     """
-    return jsonify({'prices': get_prices(event_id)})
+    version = get_event_version(event_id)
+    return conditional(version, lambda: cached(
+        'prices', event_tags(event_id) + ['roles'],
+        lambda: jsonify({'prices': get_prices(event_id)}), version))
 
 
 @app.route('/v1.0/event/<int:event_id>/role/<int:role_id>/price/',
@@ -648,7 +1127,8 @@ def price(event_id, role_id):
     :param role_id:
     :return:
     """
-    return jsonify({'price': get_price(event_id, role_id)})
+    return cached('price', event_tags(event_id) + ['roles'],
+                  lambda: jsonify({'price': get_price(event_id, role_id)}))
 
 
 @app.route('/v1.0/event/<int:event_id>/price/create/', methods=['POST'])
@@ -753,7 +1233,10 @@ def limits(event_id):
     :param event_id:
     :return:
     """
-    return jsonify({'limits': get_limits(event_id)})
+    version = get_event_version(event_id)
+    return conditional(version, lambda: cached(
+        'limits', event_tags(event_id),
+        lambda: jsonify({'limits': get_limits(event_id)}), version))
 
 
 @app.route('/v1.0/event/<int:event_id>/role/<int:role_id>/limit/',
@@ -825,7 +1308,8 @@ def param_images():
 
         # If event_id is provided, get image for that event
         if event_id is not None:
-            return jsonify(get_image(event_id))
+            return cached('images', ['images'],
+                          lambda: jsonify(get_image(event_id)))
         else:
             abort(400)
     else:
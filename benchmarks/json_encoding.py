@@ -0,0 +1,92 @@
+"""
+Compare JSON encoders on payloads like the largest responses of the API.
+
+Run from the installation folder:
+    python3 benchmarks/json_encoding.py [--repeat 20]
+"""
+import argparse
+import datetime
+import decimal
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from modules import encoding
+
+
+def events_payload(count):
+    """
+    Get list of events like get_events returns.
+    :param count:
+    :return:
+    """
+    today = datetime.date.today()
+    return [{'id': i, 'name': "Event " + str(i),
+             'updated': today - datetime.timedelta(days=i),
+             'expire': today + datetime.timedelta(days=i % 60),
+             'available': i % 2, 'version': i % 7 + 1,
+             'changed': datetime.datetime.utcnow()}
+            for i in range(count)]
+
+
+def participants_payload(count):
+    """
+    Get list of participants with forms like get_participants returns.
+    :param count:
+    :return:
+    """
+    today = datetime.date.today()
+    return [{'id': i, 'name': "Human " + str(i),
+             'email': "human" + str(i) + "@example.com", 'signed': today,
+             'paid': i % 2, 'waitlisted': 0, 'participation_id': i,
+             'role': {'id': 1, 'name': "Member", 'power': 3},
+             'form': {'name': "Human " + str(i),
+                      'email': "human" + str(i) + "@example.com",
+                      'diet': random.choice(["", "Vegan", "Gluten-free"]),
+                      'sauna': random.choice([True, False]),
+                      'extras': ["Sillis", "Bussi"]}}
+            for i in range(count)]
+
+
+def limits_payload():
+    """
+    Get limits with decimal sums like get_limits and stats return.
+    :return:
+    """
+    return [{'id': i, 'size': 50, 'filled': decimal.Decimal(i),
+             'role': {'id': i, 'name': "Role " + str(i), 'power': i}}
+            for i in range(20)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = {'events (1000)': events_payload(1000),
+                'participants (2000)': participants_payload(2000),
+                'limits (20)': limits_payload()}
+
+    encoders = [('stdlib', False)]
+    if encoding.orjson is not None:
+        encoders.append(('orjson', True))
+    else:
+        print("orjson is not installed, only stdlib is measured.")
+
+    for name, payload in payloads.items():
+        size = len(encoding.dumps(payload, fast=False))
+        print(name, "-", size, "bytes")
+
+        for label, fast in encoders:
+            seconds = min(timeit.repeat(
+                lambda: encoding.dumps(payload, fast=fast),
+                number=1, repeat=args.repeat))
+            print("  {0:8} {1:8.2f} ms".format(label, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
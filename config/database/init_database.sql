@@ -12,6 +12,8 @@ CREATE TABLE IF NOT EXISTS events (
   description VARCHAR(255),
   template VARCHAR(255) NOT NULL,
   updated DATE,
+  version INT NOT NULL DEFAULT 1,
+  changed DATETIME,
   expire DATE,
   available SMALLINT(4),
   PRIMARY KEY (id),
@@ -54,9 +56,14 @@ CREATE TABLE IF NOT EXISTS eventParticipants (
   event_id INT NOT NULL,
   human_id INT NOT NULL,
   form VARCHAR(255),
+  form_data LONGTEXT,
   paid SMALLINT(2),
+  limit_id INT,
+  waitlisted SMALLINT(1) NOT NULL DEFAULT 0,
   PRIMARY KEY (id),
   UNIQUE (form),
+  UNIQUE event_human (event_id, human_id),
+  INDEX (limit_id),
   FOREIGN KEY (event_id) REFERENCES events (id),
   FOREIGN KEY (human_id) REFERENCES humans (id)
 ) ENGINE=INNODB CHARSET=utf8;
@@ -76,7 +83,7 @@ CREATE TABLE IF NOT EXISTS limits (
   event_id INT NOT NULL,
   role_id INT,
   size INT,
-  filled INT,
+  filled INT NOT NULL DEFAULT 0,
   PRIMARY KEY (id),
   FOREIGN KEY (event_id) REFERENCES events (id),
   FOREIGN KEY (role_id) REFERENCES roles (id)
@@ -0,0 +1,7 @@
+ALTER TABLE eventParticipants ADD COLUMN IF NOT EXISTS limit_id INT AFTER paid;
+#
+ALTER TABLE eventParticipants ADD INDEX IF NOT EXISTS limit_id (limit_id);
+#
+UPDATE limits SET filled = 0 WHERE filled IS NULL;
+#
+ALTER TABLE limits MODIFY filled INT NOT NULL DEFAULT 0;
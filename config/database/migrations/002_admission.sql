@@ -0,0 +1,7 @@
+ALTER TABLE eventParticipants ADD COLUMN IF NOT EXISTS waitlisted SMALLINT(1) NOT NULL DEFAULT 0 AFTER limit_id;
+#
+DELETE p FROM eventParticipants p JOIN eventParticipants q ON q.event_id = p.event_id AND q.human_id = p.human_id AND q.id < p.id;
+#
+UPDATE limits l SET filled = (SELECT COUNT(*) FROM eventParticipants p WHERE p.limit_id = l.id);
+#
+ALTER TABLE eventParticipants ADD UNIQUE INDEX IF NOT EXISTS event_human (event_id, human_id);
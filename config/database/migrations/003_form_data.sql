@@ -0,0 +1 @@
+ALTER TABLE eventParticipants ADD COLUMN IF NOT EXISTS form_data LONGTEXT AFTER form;
@@ -0,0 +1,5 @@
+ALTER TABLE events ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 1 AFTER updated;
+#
+ALTER TABLE events ADD COLUMN IF NOT EXISTS changed DATETIME AFTER version;
+#
+UPDATE events SET changed = COALESCE(updated, UTC_TIMESTAMP()) WHERE changed IS NULL;
@@ -0,0 +1,132 @@
+import argparse
+import os
+import sys
+from modules.database import setup_db, get_event_ids, repair_limits, \
+    purge_expired_participants, migrate_forms, get_blob_keys, store
+from modules.storage import create_store
+
+MIGRATIONS = "config/database/migrations"
+
+
+def migrate(args):
+    """
+    Run database migrations in order.
+    :param args:
+    :return:
+    """
+    for name in sorted(os.listdir(MIGRATIONS)):
+        if not name.endswith(".sql"):
+            continue
+
+        print("Migrating:", name)
+        with open(os.path.join(MIGRATIONS, name), "r") as sql_file:
+            if not setup_db(sql_file.read()):
+                return False
+
+    return True
+
+
+def repair(args):
+    """
+    Recalculate filled sizes of limits.
+    :param args:
+    :return:
+    """
+    event_ids = args.event_id or get_event_ids()
+    succeeded = True
+
+    for event_id in event_ids:
+        if not repair_limits(event_id):
+            print(' -- WARNING! Unable to repair limits of event with ID:',
+                  event_id, "--")
+            succeeded = False
+
+    return succeeded
+
+
+def purge(args):
+    """
+    Delete participants of events that have expired long ago.
+    :param args:
+    :return:
+    """
+    deleted = purge_expired_participants(args.days, args.batch_size)
+    print("Deleted", deleted, "participants.")
+
+    return True
+
+
+def move_forms(args):
+    """
+    Move forms of participants from files to database.
+    :param args:
+    :return:
+    """
+    moved = migrate_forms(args.batch_size, args.remove_files)
+    print("Moved", moved, "forms.")
+
+    return True
+
+
+def copy_blobs(args):
+    """
+    Copy templates, descriptions and forms to another store.
+    :param args:
+    :return:
+    """
+    target = create_store({'backend': args.backend, 'path': args.path})
+    keys = get_blob_keys()
+    copied = 0
+
+    for i in range(0, len(keys), args.batch_size):
+        blobs = store.get_many(keys[i:i + args.batch_size])
+        target.put_many(blobs)
+        copied += len(blobs)
+
+    print("Copied", copied, "of", len(keys), "blobs.")
+
+    return copied == len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eventum API maintenance.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    command = commands.add_parser("migrate", help="Run database migrations.")
+    command.set_defaults(run=migrate)
+
+    command = commands.add_parser("repair-limits",
+                                  help="Recalculate filled sizes of limits.")
+    command.add_argument("event_id", type=int, nargs="*",
+                         help="Events to repair, all if not given.")
+    command.set_defaults(run=repair)
+
+    command = commands.add_parser("purge-participants",
+                                  help="Delete participants of events "
+                                       "expired over given days ago.")
+    command.add_argument("--days", type=int, default=30)
+    command.add_argument("--batch-size", type=int, default=500)
+    command.set_defaults(run=purge)
+
+    command = commands.add_parser("migrate-forms",
+                                  help="Move forms from files to database.")
+    command.add_argument("--batch-size", type=int, default=500)
+    command.add_argument("--remove-files", action="store_true",
+                         help="Delete form files after moving them.")
+    command.set_defaults(run=move_forms)
+
+    command = commands.add_parser("copy-blobs",
+                                  help="Copy templates, descriptions and "
+                                       "forms to another storage backend.")
+    command.add_argument("backend", choices=["files", "sqlite"])
+    command.add_argument("--path", help="File of sqlite backend.")
+    command.add_argument("--batch-size", type=int, default=500)
+    command.set_defaults(run=copy_blobs)
+
+    args = parser.parse_args()
+    return 0 if args.run(args) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class Cache:
+    """
+    In-process cache of one worker. Least recently used entries are evicted
+    when maxsize is reached and entries older than ttl seconds are ignored.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        """
+        Create empty cache. None means no limit.
+        :param maxsize:
+        :param ttl:
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get cached value for key or default if missing or expired.
+        :param key:
+        :param default:
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and self.ttl is not None and \
+                    time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """
+        Store value for key.
+        :param key:
+        :param value:
+        :return:
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Forget key, or everything if key is not given.
+        :param key:
+        :return:
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def invalidate_where(self, match):
+        """
+        Forget all keys for which match returns True.
+        :param match:
+        :return:
+        """
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                del self._entries[key]
+
+    def stats(self):
+        """
+        Get hit and miss counters and size of cache.
+        :return:
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+class SharedCache:
+    """
+    Cache shared by all worker processes through one SQLite file, best
+    kept on a memory backed file system such as /dev/shm. Entries have
+    tags they are invalidated by. Every invalidation bumps generation of
+    its tags, so data built before it can be refused when stored after
+    it. Least recently used entries are evicted when their total size
+    grows over max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl=60):
+        """
+        Open or create cache in path.
+        :param path:
+        :param max_bytes:
+        :param ttl:
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                       "key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                       "size INTEGER NOT NULL, expires REAL NOT NULL, "
+                       "used REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_used "
+                       "ON entries (used)")
+            db.execute("CREATE TABLE IF NOT EXISTS tags ("
+                       "tag TEXT NOT NULL, key TEXT NOT NULL, "
+                       "PRIMARY KEY (tag, key)) WITHOUT ROWID")
+            db.execute("CREATE INDEX IF NOT EXISTS tags_key ON tags (key)")
+            db.execute("CREATE TABLE IF NOT EXISTS generations ("
+                       "tag TEXT PRIMARY KEY, "
+                       "generation INTEGER NOT NULL) WITHOUT ROWID")
+
+    def _connection(self):
+        """
+        Get connection of current thread and process.
+        :return:
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")
+            self._local.db = db
+            self._local.pid = os.getpid()
+
+        return db
+
+    def get(self, key):
+        """
+        Get cached data for key or None if missing or expired.
+        :param key:
+        :return:
+        """
+        now = time.time()
+        try:
+            db = self._connection()
+            row = db.execute("SELECT data, expires, used FROM entries "
+                             "WHERE key=?", (key,)).fetchone()
+
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+
+            # Order of use doesn't need to be exact, so it is written
+            # only once in a while
+            if now - row[2] > 1:
+                with db:
+                    db.execute("UPDATE entries SET used=? WHERE key=?",
+                               (now, key))
+        except sqlite3.Error as e:
+            print(' -- WARNING! Shared cache unavailable', e, "--")
+            return None
+
+        self.hits += 1
+        return row[0]
+
+    def generation(self, tags):
+        """
+        Get generation of tags, None if it can't be read.
+        :param tags:
+        :return:
+        """
+        try:
+            return self._generation(self._connection(), tags)
+        except sqlite3.Error as e:
+            print(' -- WARNING! Shared cache unavailable', e, "--")
+            return None
+
+    def _generation(self, db, tags):
+        """
+        Get generations of tags in sorted order, 0 for tags never
+        invalidated.
+        :param db:
+        :param tags:
+        :return:
+        """
+        tags = sorted(set(tags))
+        if len(tags) == 0:
+            return ()
+
+        rows = dict(db.execute(
+            "SELECT tag, generation FROM generations "
+            "WHERE tag IN ({0})".format(", ".join("?" * len(tags))),
+            tags).fetchall())
+
+        return tuple(rows.get(tag, 0) for tag in tags)
+
+    def set(self, key, data, tags=(), ttl=None, generation=None):
+        """
+        Store data for key with tags it is invalidated by. With
+        generation, data is stored only if tags haven't been invalidated
+        since generation was read.
+        :param key:
+        :param data:
+        :param tags:
+        :param ttl:
+        :param generation:
+        :return:
+        """
+        now = time.time()
+        if ttl is None:
+            ttl = self.ttl
+
+        try:
+            with self._connection() as db:
+
+                # Check and write can't be split by an invalidation
+                db.execute("BEGIN IMMEDIATE")
+                if generation is not None and \
+                        self._generation(db, tags) != tuple(generation):
+                    return False
+
+                db.execute("INSERT OR REPLACE INTO entries (key, data, "
+                           "size, expires, used) VALUES (?, ?, ?, ?, ?)",
+                           (key, data, len(data), now + ttl, now))
+                db.execute("DELETE FROM tags WHERE key=?", (key,))
+                db.executemany("INSERT OR IGNORE INTO tags (tag, key) "
+                               "VALUES (?, ?)", [(tag, key) for tag in tags])
+                self._evict(db, now)
+        except sqlite3.Error as e:
+            print(' -- WARNING! Shared cache unavailable', e, "--")
+            return False
+
+        return True
+
+    def _evict(self, db, now):
+        """
+        Remove expired entries and then least recently used ones until
+        cache fits in max_bytes.
+        :param db:
+        :param now:
+        :return:
+        """
+        total = db.execute("SELECT COALESCE(SUM(size), 0) "
+                           "FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        keys = []
+        rows = db.execute("SELECT key, size FROM entries "
+                          "ORDER BY expires < ? DESC, used", (now,))
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            keys.append((key,))
+            total -= size
+
+        db.executemany("DELETE FROM entries WHERE key=?", keys)
+        db.executemany("DELETE FROM tags WHERE key=?", keys)
+
+    def invalidate(self, tags):
+        """
+        Forget all entries with any of tags.
+        :param tags:
+        :return:
+        """
+        tags = list(tags)
+        if len(tags) == 0:
+            return True
+
+        try:
+            with self._connection() as db:
+                db.execute("BEGIN IMMEDIATE")
+                keys = db.execute(
+                    "SELECT DISTINCT key FROM tags WHERE tag IN ({0})".format(
+                        ", ".join("?" * len(tags))), tags).fetchall()
+                db.executemany("DELETE FROM entries WHERE key=?", keys)
+                db.executemany("DELETE FROM tags WHERE key=?", keys)
+                db.executemany("INSERT OR IGNORE INTO generations (tag, "
+                               "generation) VALUES (?, 0)",
+                               [(tag,) for tag in tags])
+                db.executemany("UPDATE generations SET "
+                               "generation=generation+1 WHERE tag=?",
+                               [(tag,) for tag in tags])
+        except sqlite3.Error as e:
+            print(' -- WARNING! Unable to invalidate shared cache', tags, e,
+                  "--")
+            return False
+
+        return True
+
+    def stats(self):
+        """
+        Get hit and miss counters of this process and size of cache.
+        :return:
+        """
+        try:
+            size, used = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) "
+                "FROM entries").fetchone()
+        except sqlite3.Error:
+            size, used = None, None
+
+        return {'hits': self.hits, 'misses': self.misses, 'size': size,
+                'bytes': used, 'max_bytes': self.max_bytes}
+
+
+def create_shared_cache(settings):
+    """
+    Create shared cache based on responses block of config,
+    None if it isn't enabled.
+    :param settings:
+    :return:
+    """
+    if not settings.get('path'):
+        return None
+
+    return SharedCache(settings['path'],
+                       int(settings.get('max_bytes', 64 * 1024 * 1024)),
+                       float(settings.get('ttl', {}).get('default', 60)))
@@ -0,0 +1,36 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def codings():
+    """
+    Get content codings that can be used, in order of preference.
+    :return:
+    """
+    if brotli is not None:
+        return ['br', 'gzip']
+
+    return ['gzip']
+
+
+def compress(data, coding, settings):
+    """
+    Compress data with given content coding, based on compression
+    block of config.
+    :param data:
+    :param coding:
+    :param settings:
+    :return:
+    """
+    if coding == 'br':
+        return brotli.compress(data,
+                               quality=int(settings.get('brotli_quality', 5)))
+    elif coding == 'gzip':
+        return gzip.compress(data,
+                             compresslevel=int(settings.get('gzip_level', 6)))
+
+    raise ValueError("Unknown content coding: " + coding)
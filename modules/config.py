@@ -0,0 +1,242 @@
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+
+CONFIG_PATH = "config/config.json"
+
+# Seconds between checks of config file's modification time.
+CHECK_INTERVAL = 1.0
+
+# Keys config must have and their types. Keys not listed here are optional
+# and code reading them provides defaults.
+SCHEMA = {
+    'database': {
+        'host': str,
+        'database': str,
+        'username': str,
+        'password': str,
+    },
+    'json': {
+        'templates': str,
+        'form_root': str,
+        'memberlist': str,
+    },
+    'event_description_root': str,
+    'media_root': str,
+    'file_extensions': list,
+    'image_url': str,
+    'tables': {
+        'users': str,
+        'events': str,
+        'eventImages': str,
+        'roles': str,
+        'humans': str,
+        'eventParticipants': str,
+        'prices': str,
+        'limits': str,
+    },
+    'secret': str,
+    'setup_done': bool,
+}
+
+
+class ConfigError(ValueError):
+    """
+    Raised when config is missing keys or has values of wrong type.
+    """
+
+
+def validate(data, schema=SCHEMA, prefix=""):
+    """
+    Check data against schema, raise ConfigError on first problem.
+    :param data:
+    :param schema:
+    :param prefix:
+    :return:
+    """
+    if not isinstance(data, dict):
+        raise ConfigError("Config " + (prefix or "root") +
+                          " should be an object")
+
+    for key, expected in schema.items():
+        name = prefix + key
+        if key not in data:
+            raise ConfigError("Config is missing " + name)
+
+        if isinstance(expected, dict):
+            validate(data[key], expected, name + ".")
+        elif not isinstance(data[key], expected):
+            raise ConfigError("Config " + name + " should be of type " +
+                              expected.__name__)
+
+
+class Section:
+    """
+    Read-only view of a block of config. Values are available as
+    attributes, blocks as nested sections. Item access returns the plain
+    values like the dict config used to be.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def _values(self):
+        return self._data
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        try:
+            value = self._values()[name]
+        except KeyError:
+            raise AttributeError(name)
+
+        if isinstance(value, dict):
+            return Section(value)
+        return value
+
+    def __getitem__(self, key):
+        return self._values()[key]
+
+    def __contains__(self, key):
+        return key in self._values()
+
+    def __iter__(self):
+        return iter(self._values())
+
+    def get(self, key, default=None):
+        return self._values().get(key, default)
+
+    def keys(self):
+        return self._values().keys()
+
+    def items(self):
+        return self._values().items()
+
+
+class Config(Section):
+    """
+    Config of the process. It is loaded once and reloaded when the file
+    changes or SIGHUP is received. Reload swaps the whole dict at once,
+    so readers never see a half updated config.
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        """
+        Load and validate config from path.
+        :param path:
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._stale = False
+        self._checked = time.monotonic()
+        self._stat, data = self._read()
+        super().__init__(data)
+
+    def _read(self):
+        """
+        Read and validate config file.
+        :return:
+        """
+        stat = os.stat(self.path)
+        with open(self.path, "r") as conf:
+            data = json.load(conf)
+
+        validate(data)
+
+        return (stat.st_mtime_ns, stat.st_size), data
+
+    def _values(self):
+        if self._stale or \
+                time.monotonic() - self._checked > CHECK_INTERVAL:
+            self.refresh()
+
+        return self._data
+
+    def refresh(self):
+        """
+        Reload config if file has changed or reload has been requested.
+        Invalid config is reported and the previous one kept.
+        :return:
+        """
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+                if not self._stale and \
+                        (stat.st_mtime_ns, stat.st_size) == self._stat:
+                    return
+
+                self._stat, self._data = self._read()
+            except (OSError, ValueError) as e:
+                print(' -- WARNING! Unable to reload config', self.path, e,
+                      "--")
+            finally:
+                self._stale = False
+
+    def request_reload(self, *args):
+        """
+        Reload config on next access. Works as signal handler.
+        :param args:
+        :return:
+        """
+        self._stale = True
+
+    def update(self, values):
+        """
+        Update keys of config and save it. File is replaced by renaming
+        a complete temporary file, so other workers never read it
+        half written.
+        :param values:
+        :return:
+        """
+        with self._lock:
+            stat, data = self._read()
+            data.update(values)
+            validate(data)
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, temp = tempfile.mkstemp(dir=directory, prefix=".config.")
+            try:
+                with os.fdopen(fd, "w") as conf:
+                    json.dump(data, conf, indent=2)
+                    conf.flush()
+                    os.fsync(conf.fileno())
+
+                os.chmod(temp, os.stat(self.path).st_mode & 0o777)
+                os.replace(temp, self.path)
+            except OSError:
+                os.remove(temp)
+                raise
+
+            stat = os.stat(self.path)
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+            self._data = data
+            self._checked = time.monotonic()
+
+
+def reload_on_sighup(config):
+    """
+    Reload config when process receives SIGHUP. uWSGI uses SIGHUP
+    itself, so under it changes are picked up from modification time only.
+    :param config:
+    :return:
+    """
+    try:
+        import uwsgi
+        return False
+    except ImportError:
+        pass
+
+    try:
+        signal.signal(signal.SIGHUP, config.request_reload)
+    except (ValueError, AttributeError):
+
+        # Not in main thread or platform without SIGHUP
+        return False
+
+    return True
@@ -1,9 +1,25 @@
+import copy
 import datetime
 import json
 import os
-import pymysql
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
 from pymysql import MySQLError
-from .utils import get_config, generate_password, get_json, get_txt
+from pymysql.cursors import SSDictCursor
+from .cache import Cache, create_shared_cache
+from .pool import ConnectionPool
+from .storage import create_store
+from .utils import get_config, generate_password, is_member, \
+    normalize_email
+
+# Columns of events that can be asked for with fields.
+EVENT_FIELDS = ('id', 'name', 'updated', 'expire', 'available')
+
+# Sub-resources of events that can be expanded.
+EVENT_EXPANSIONS = ('limits', 'prices', 'participants', 'template',
+                    'description')
 
 # Read configuration from config/config.json
 config = get_config()
@@ -12,9 +28,248 @@ config = get_config()
 database = config['database']
 tables = config['tables']
 
+# Connections are shared by all queries of one worker.
+pool = ConnectionPool(database)
+
+# Where forms of participants are stored, 'files' or 'database'.
+form_storage = config.get('forms', {}).get('storage', 'files')
+
+# Templates, descriptions and forms stored as 'files' are kept here,
+# keyed by locations stored in database.
+store = create_store(config.get('storage', {}))
+
+# Unit of work of the current thread, if one is open.
+_local = threading.local()
+
+# Roles change rarely, so every worker keeps them in memory for a while.
+_role_cache = Cache(ttl=config.get('cache', {}).get('roles_ttl', 60))
+
+# Users of JWT identities by id, False for ids that don't exist.
+_identity_cache = Cache(maxsize=1024,
+                        ttl=config.get('cache', {}).get('identities_ttl', 30))
+
+# Parsed templates and descriptions keyed by path and modification time.
+_content_cache = Cache(maxsize=config.get('cache', {}).get('content_size',
+                                                           256))
+
+# Public responses shared by all workers, None if disabled.
+responses = create_shared_cache(config.get('responses', {}))
+
 # Tools
 
 
+@lru_cache(maxsize=None)
+def statement(template):
+    """
+    Fill table names into statement template once per worker, so every
+    lookup sends exactly the same statement text with its parameters.
+    :param template:
+    :return:
+    """
+    return template.format(**tables)
+
+
+class UnitOfWork:
+    """
+    Connection and state shared by all statements of one transaction.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.failed = False
+        self.committed = False
+        self.on_commit = []
+
+
+class RequestScope:
+    """
+    Connection and rows loaded by one request or batch of requests.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.broken = False
+        self.rows = {}
+
+
+@contextmanager
+def request_scope():
+    """
+    Run all statements inside on one connection without a transaction
+    and keep rows loaded by them in an identity map, so the same rows
+    are read only once. Map is cleared whenever something is written.
+    :return:
+    """
+    scope = getattr(_local, 'scope', None)
+    if scope is not None:
+        yield scope
+        return
+
+    db = pool.acquire()
+    scope = RequestScope(db)
+    _local.scope = scope
+
+    try:
+        yield scope
+    finally:
+        _local.scope = None
+        pool.release(db, scope.broken)
+
+
+def _remember(key, load):
+    """
+    Get rows for key from identity map of current request scope, loading
+    them only once. Copies are returned, because callers modify them.
+    :param key:
+    :param load:
+    :return:
+    """
+    scope = getattr(_local, 'scope', None)
+    if scope is None:
+        return load()
+
+    if key not in scope.rows:
+        scope.rows[key] = load()
+
+    return copy.deepcopy(scope.rows[key])
+
+
+def _connection():
+    """
+    Get connection of current request scope, or a pooled one and True
+    if it has to be released after use.
+    :return:
+    """
+    scope = getattr(_local, 'scope', None)
+    if scope is not None:
+        return scope.connection, False
+
+    return pool.acquire(), True
+
+
+@contextmanager
+def transaction():
+    """
+    Run all statements inside on one connection and commit them once
+    at the end. If any statement fails, everything is rolled back.
+    Nested transactions join the outermost one.
+    :return:
+    """
+    unit = getattr(_local, 'unit', None)
+    if unit is not None:
+        yield unit
+        return
+
+    db, pooled = _connection()
+    unit = UnitOfWork(db)
+    _local.unit = unit
+    broken = False
+
+    try:
+        db.begin()
+        yield unit
+
+        if unit.failed:
+            db.rollback()
+        else:
+            try:
+                db.commit()
+                unit.committed = True
+            except MySQLError as e:
+                unit.failed = True
+                print(e, e.args)
+                db.rollback()
+    except BaseException:
+        try:
+            db.rollback()
+        except MySQLError:
+            broken = True
+        raise
+    finally:
+        _local.unit = None
+        if pooled:
+            pool.release(db, broken)
+        elif broken:
+            _local.scope.broken = True
+
+    if unit.committed:
+        for callback in unit.on_commit:
+            callback()
+
+
+def after_commit(callback):
+    """
+    Call callback once current transaction has been committed,
+    right away if there is none.
+    :param callback:
+    :return:
+    """
+    unit = getattr(_local, 'unit', None)
+    if unit is not None:
+        unit.on_commit.append(callback)
+    else:
+        callback()
+
+
+def invalidate_responses(*tags):
+    """
+    Forget shared responses with any of tags once changes are committed.
+    :param tags:
+    :return:
+    """
+    if responses is not None:
+        after_commit(lambda: responses.invalidate(tags))
+
+
+def _execute(sql, params=None, fetch=None, many=False):
+    """
+    Execute sql on connection of current transaction or on a pooled one.
+    Fetch can be 'one', 'all' or 'id' for id generated by an insert,
+    otherwise number of affected rows is returned. With many, params is
+    a sequence of parameter tuples.
+    Raises MySQLError if execution fails.
+    :param sql:
+    :param params:
+    :param fetch:
+    :param many:
+    :return:
+    """
+    unit = getattr(_local, 'unit', None)
+    if unit is not None:
+        db, pooled = unit.connection, False
+    else:
+        db, pooled = _connection()
+
+    # Rows remembered by request scope may change with any write
+    scope = getattr(_local, 'scope', None)
+    if scope is not None and fetch not in ('one', 'all'):
+        scope.rows.clear()
+
+    try:
+        with db.cursor() as cursor:
+            if many:
+                cursor.executemany(sql, params)
+            else:
+                cursor.execute(sql, params)
+
+            if fetch == 'one':
+                return cursor.fetchone()
+            elif fetch == 'all':
+                return cursor.fetchall()
+            elif fetch == 'id':
+                return cursor.lastrowid
+            return cursor.rowcount
+    except MySQLError:
+
+        # Failed statement rolls back the whole transaction.
+        if unit is not None:
+            unit.failed = True
+        raise
+    finally:
+        if pooled:
+            pool.release(db)
+
+
 def setup_db(sql):
     """
     Setup requires multiple statements with insert.
@@ -34,28 +289,69 @@ def setup_db(sql):
     return True
 
 
-def insert(sql):
+def insert(sql, params=None):
     """
     Insert given sql into database.
     :param sql:
+    :param params:
     :return:
     """
-    db = pymysql.connect(database['host'], database['username'],
-                         database['password'], database['database'],
-                         cursorclass=pymysql.cursors.DictCursor)
+    try:
+        _execute(sql, params)
+        return True
+    except MySQLError as e:
 
+        # Print error if execute fails.
+        print(e, e.args)
+        return False
+
+
+def insert_id(sql, params=None):
+    """
+    Insert given sql into database and return id of the new row,
+    None if fails.
+    :param sql:
+    :param params:
+    :return:
+    """
     try:
-        with db.cursor() as cursor:
-            cursor.execute(sql)
+        return _execute(sql, params, 'id')
+    except MySQLError as e:
+
+        # Print error if execute fails.
+        print(e, e.args)
+        return None
 
-        db.commit()
-        db.close()
+
+def update(sql, params=None):
+    """
+    Execute given sql and return number of affected rows, None if fails.
+    :param sql:
+    :param params:
+    :return:
+    """
+    try:
+        return _execute(sql, params)
+    except MySQLError as e:
+
+        # Print error if execute fails.
+        print(e, e.args)
+        return None
+
+
+def insert_many(sql, params):
+    """
+    Execute given sql once for every parameter tuple in params.
+    :param sql:
+    :param params:
+    :return:
+    """
+    try:
+        _execute(sql, params, many=True)
         return True
     except MySQLError as e:
 
-        # Rollback and print error if commit or execute fails.
-        db.rollback()
-        db.close()
+        # Print error if execute fails.
         print(e, e.args)
         return False
 
@@ -66,55 +362,41 @@ def delete_user(user_id):
     :param user_id:
     :return:
     """
-    sql = "DELETE FROM {0} WHERE `id`='{1}';".format(tables['users'], user_id)
-    return insert(sql)
+    sql = statement("DELETE FROM {users} WHERE `id`=%s;")
+    if insert(sql, (user_id,)):
+        after_commit(lambda: invalidate_identity(user_id))
+        return True
 
+    return False
 
-def get_one(sql):
+
+def get_one(sql, params=None):
     """
     Get one object from database with sql.
     :param sql:
+    :param params:
     :return:
     """
-    db = pymysql.connect(database['host'], database['username'],
-                         database['password'], database['database'],
-                         cursorclass=pymysql.cursors.DictCursor)
-
     try:
-        with db.cursor() as cursor:
-            cursor.execute(sql)
-            data = cursor.fetchone()
-
-        db.close()
-        return data
+        return _execute(sql, params, 'one')
     except MySQLError:
 
         # Return None if fails
-        db.close()
         return None
 
 
-def get_all(sql):
+def get_all(sql, params=None):
     """
     Get all objects from database with sql.
     :param sql:
+    :param params:
     :return:
     """
-    db = pymysql.connect(database['host'], database['username'],
-                         database['password'], database['database'],
-                         cursorclass=pymysql.cursors.DictCursor)
-
     try:
-        with db.cursor() as cursor:
-            cursor.execute(sql)
-            data = cursor.fetchall()
-
-        db.close()
-        return data
+        return _execute(sql, params, 'all')
     except MySQLError:
 
         # Return None if fails
-        db.close()
         return None
 
 
@@ -135,10 +417,73 @@ def get_last_updated():
     Get last updated event.
     :return:
     """
-    sql = "SELECT MAX(updated) FROM {0};".format(tables['events'])
+    sql = statement("SELECT MAX(updated) FROM {events};")
     return get_one(sql)
 
 
+def get_event_version(event_id):
+    """
+    Get version and time of last change of event, including its
+    participants, prices and limits. None if event doesn't exist.
+    :param event_id:
+    :return:
+    """
+    sql = statement("SELECT `id`, `version`, `changed` FROM {events} "
+                    "WHERE `id`=%s;")
+    event = _remember(('version', str(event_id)),
+                      lambda: get_one(sql, (event_id,)))
+    if event is None:
+        return None
+
+    return {'etag': "{0}-{1}".format(event['id'], event['version']),
+            'changed': event['changed']}
+
+
+def get_events_version():
+    """
+    Get version and time of last change of all events.
+    :return:
+    """
+    sql = statement("SELECT COUNT(*) AS `count`, "
+                    "COALESCE(SUM(`version`), 0) AS `version`, "
+                    "MAX(`changed`) AS `changed` FROM {events};")
+    events = get_one(sql)
+    if events is None:
+        return None
+
+    return {'etag': "{0}-{1}".format(events['count'], events['version']),
+            'changed': events['changed']}
+
+
+def touch_events(event_ids=None):
+    """
+    Bump version of events after something in them has changed,
+    all events if event_ids is not given.
+    :param event_ids:
+    :return:
+    """
+    changed = datetime.datetime.utcnow()
+
+    if event_ids is None:
+        sql = statement("UPDATE `{events}` SET `version`=`version`+1, "
+                        "`changed`=%s;")
+        if update(sql, (changed,)) is None:
+            return False
+
+        invalidate_responses('events', 'event')
+        return True
+
+    event_ids = list(event_ids)
+    sql = statement("UPDATE `{events}` SET `version`=`version`+1, "
+                    "`changed`=%s WHERE `id` IN %s;")
+    if update(sql, (changed, event_ids)) is None:
+        return False
+
+    invalidate_responses('events', *["event:" + str(event_id)
+                                     for event_id in event_ids])
+    return True
+
+
 # Authentication
 
 def create_user(username):
@@ -150,10 +495,10 @@ def create_user(username):
     password = generate_password(64)
 
     # Hash the password while insterting to database
-    sql = "INSERT INTO {0} (`password`, `username`) VALUES " \
-          "(ENCRYPT('{1}', CONCAT('$6$', SUBSTRING(SHA(RAND()), -16)))," \
-          " '{2}');".format(tables['users'], password, username)
-    if insert(sql):
+    sql = statement("INSERT INTO {users} (`password`, `username`) VALUES "
+                    "(ENCRYPT(%s, CONCAT('$6$', SUBSTRING(SHA(RAND()), -16)))"
+                    ", %s);")
+    if insert(sql, (password, username)):
         return password
     else:
         return {'Error': 'Cannot create password.'}
@@ -166,17 +511,21 @@ def update_user(user_id):
     :return:
     """
     password = generate_password(64)
-    user = get_user(user_id, True)
-
-    # Hash the password while inserting to database
-    sql = "UPDATE `{0}` SET `password`=ENCRYPT('{1}', " \
-          "CONCAT('$6$', SUBSTRING(SHA(RAND()), -16))), `username`='{2}' " \
-          "WHERE `id`='{3}';".format(
-            tables['users'], password, user['username'], user_id)
-    if insert(sql):
-        return password
-    else:
+
+    with transaction() as unit:
+        user = get_user(user_id, True)
+
+        # Hash the password while inserting to database
+        sql = statement("UPDATE `{users}` SET `password`=ENCRYPT(%s, "
+                        "CONCAT('$6$', SUBSTRING(SHA(RAND()), -16))), "
+                        "`username`=%s WHERE `id`=%s;")
+        insert(sql, (password, user['username'], user_id))
+        after_commit(lambda: invalidate_identity(user_id))
+
+    if unit.failed:
         return {'Error': 'Cannot update password.'}
+    else:
+        return password
 
 
 def get_user(search, useId=False):
@@ -188,21 +537,64 @@ def get_user(search, useId=False):
     :return:
     """
     if useId:
-        sql = "SELECT * FROM {0} WHERE `id`='{1}';".format(
-            tables['users'], search)
+        sql = statement("SELECT * FROM {users} WHERE `id`=%s;")
     else:
-        sql = "SELECT * FROM {0} WHERE `user`='{1}';".format(
-            tables['users'], search)
-    return get_one(sql)
+        sql = statement("SELECT * FROM {users} WHERE `username`=%s;")
+    return get_one(sql, (search,))
 
 
-def get_users():
+def get_identity(user_id):
     """
-    Get all users for JWT.
+    Get user of JWT identity, cached for a while. Users that don't exist
+    are cached too, errors are not.
+    :param user_id:
     :return:
     """
-    sql = "SELECT * FROM {0};".format(tables['users'])
-    return get_all(sql)
+    try:
+        key = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user = _identity_cache.get(key)
+    if user is None:
+        sql = statement("SELECT * FROM {users} WHERE `id`=%s;")
+        try:
+            user = _execute(sql, (key,), 'one')
+        except MySQLError as e:
+            print(e, e.args)
+            return None
+
+        _identity_cache.set(key, user if user is not None else False)
+
+    return dict(user) if user else None
+
+
+def invalidate_identity(user_id):
+    """
+    Forget cached user of JWT identity.
+    :param user_id:
+    :return:
+    """
+    try:
+        _identity_cache.invalidate(int(user_id))
+    except (TypeError, ValueError):
+        pass
+
+
+def get_users(limit=None, after=0):
+    """
+    Get all users for JWT, or at most limit of them with id after given.
+    :param limit:
+    :param after:
+    :return:
+    """
+    if limit is None:
+        sql = statement("SELECT * FROM {users};")
+        return get_all(sql)
+
+    sql = statement("SELECT * FROM {users} WHERE `id`>%s "
+                    "ORDER BY `id` LIMIT %s;")
+    return get_all(sql, (after, limit))
 
 
 def login(username, password):
@@ -214,70 +606,134 @@ def login(username, password):
     """
 
     # Compare with MySQL's Encrypt -function.
-    sql = "SELECT * FROM {0} WHERE `password`=ENCRYPT('{1}', `password`) " \
-          "AND `username`='{2}';".format(tables['users'], password, username)
-    return get_one(sql)
+    sql = statement("SELECT * FROM {users} WHERE "
+                    "`password`=ENCRYPT(%s, `password`) AND `username`=%s;")
+    return get_one(sql, (password, username))
 
 
 # Events
 
 
-def get_events():
+def get_events(limit=None, after=0, fields=None, expand=()):
     """
-    Get all events.
+    Get all events, or at most limit of them with id after given.
+    Fields and expand work like in get_event, nothing is expanded
+    by default.
+    :param limit:
+    :param after:
+    :param fields:
+    :param expand:
     :return:
     """
-    sql = "SELECT * FROM {0};".format(tables['events'])
-    events = get_all(sql)
+    columns = _event_columns(fields, expand)
+    if limit is None:
+        sql = statement("SELECT " + columns + " FROM {events};")
+        events = get_all(sql)
+    else:
+        sql = statement("SELECT " + columns + " FROM {events} "
+                        "WHERE `id`>%s ORDER BY `id` LIMIT %s;")
+        events = get_all(sql, (after, limit))
+
     for event in events:
-        # Delete participators if
-        # event's sign up has expired over 30 days ago.
-        if datetime.timedelta(days=30) < (datetime.datetime.utcnow().date() -
-                                          event['expire']):
-            delete_participants(event['id'])
-        else:
-            # Simplify returned events
-            del event['template']
-            del event['description']
+        _expand_event(event, expand)
     return events
 
 
-def get_event(event_id, participants=False, simple=False):
+def get_event_ids():
+    """
+    Get ids of all events.
+    :return:
+    """
+    sql = statement("SELECT `id` FROM {events} ORDER BY `id`;")
+    return [event['id'] for event in get_all(sql)]
+
+
+def get_event(event_id, participants=False, simple=False, fields=None,
+              expand=None):
     """
     Get one event based on event_id.
+    Fields limits columns of event, id is always included. Expand lists
+    sub-resources to add, by default limits, prices, template and
+    description unless simple, and participants if wanted.
     :param event_id:
     :param participants:
     :param simple:
+    :param fields:
+    :param expand:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `id`={1};".format(
-        tables['events'], event_id)
-    event = get_one(sql)
-    if participants:
-
-        # Delete participators if event's sign up has expired over 30 days ago.
-        if datetime.timedelta(days=30) < (datetime.datetime.utcnow().date() -
-                                          event['expire']):
-            delete_participants(event['id'])
+    if expand is None:
+        if simple:
+            expand = set()
         else:
-            # Add participators to event
-            participants = get_participants(event['id'])
-            event['participants'] = participants
+            expand = {'limits', 'prices', 'template', 'description'}
+
+        if participants:
+            expand.add('participants')
+
+    sql = statement("SELECT " + _event_columns(fields, expand) +
+                    " FROM {events} WHERE `id`=%s;")
+    event = _remember(('event', str(event_id), sql),
+                      lambda: get_one(sql, (event_id,)))
+    if event is None:
+        return None
+
+    return _expand_event(event, expand)
+
+
+def _event_columns(fields, expand):
+    """
+    Get columns of events to select for fields and expanded
+    sub-resources. All columns if fields is None.
+    :param fields:
+    :param expand:
+    :return:
+    """
+    if fields is None:
+        return "*"
+
+    columns = ['id'] + [field for field in EVENT_FIELDS
+                        if field in fields and field != 'id']
+
+    # Template and description are read based on their locations
+    columns += [column for column in ('template', 'description')
+                if column in expand]
 
-    if not simple:
-        # Add non-simple elements to event
+    return ", ".join("`" + column + "`" for column in columns)
+
+
+def _expand_event(event, expand):
+    """
+    Add expanded sub-resources to event and remove locations of
+    template and description that weren't asked for.
+    :param event:
+    :param expand:
+    :return:
+    """
+    if 'participants' in expand:
+
+        # Add participators to event
+        event['participants'] = get_participants(event['id'])
+
+    if 'limits' in expand:
         event['limits'] = get_limits(event['id'])
+
+    if 'prices' in expand:
         event['prices'] = get_prices(event['id'])
-        event['template'] = get_json(event['template'])
 
-        # Get description for event if exists.
+    if 'template' in expand:
+        event['template'] = get_template(event['template'])
+    else:
+        event.pop('template', None)
+
+    # Get description for event if exists.
+    if 'description' in expand:
         if event['description'] is not None:
-            event['description'] = get_txt(event['description'])
+            event['description'] = get_description(event['description'])
         else:
             event['description'] = ""
     else:
-        del event['template']
-        del event['description']
+        event.pop('description', None)
 
     return event
 
@@ -293,36 +749,44 @@ def create_event(name, template, expire, description, available):
     :return:
     """
 
-    # Get file locations for template and description.
-    template_file = os.path.join(config['json']['templates'], str(
-        get_newest(tables['events'])+1) + "_" + name + ".json")
-    description_file = os.path.join(config['event_description_root'], str(
-        get_newest(tables['events'])+1)+"_"+name+".txt")
-
-    # Create event directory to store forms
-    directory = os.path.join(config['json']['form_root'], str(
-        get_newest(tables['events'])+1) + "_" + name)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    # Store template in JSON format and description in normal text format
-    with open(template_file, "w") as file:
-        json.dump(template, file)
-    with open(description_file, "w") as d_file:
-        d_file.write(description)
-
-    # Insert event to database
-    updated = datetime.datetime.now()
-    sql = "INSERT INTO {0} (`name`, `template`, `updated`, " \
-          "`expire`, `description`, `available`) VALUES ('{1}', " \
-          "'{2}', '{3}', '{4}', '{5}', '{6}');".format(
-            tables['events'], name, template_file, updated, expire,
-            description_file, available)
-
-    if insert(sql):
-        return get_event(get_newest(tables['events']))
-    else:
+    with transaction() as unit:
+
+        # Insert event to database. Template location is temporary,
+        # because file names are based on id of the event.
+        updated = datetime.datetime.now()
+        sql = statement("INSERT INTO {events} (`name`, `template`, "
+                        "`updated`, `changed`, `expire`, `available`) "
+                        "VALUES (%s, %s, %s, %s, %s, %s);")
+        event_id = insert_id(sql, (name, uuid.uuid4().hex, updated,
+                                   datetime.datetime.utcnow(), expire,
+                                   available))
+
+        if event_id is not None:
+            invalidate_responses('events', "event:" + str(event_id))
+
+            # Get file locations for template and description.
+            template_file = os.path.join(config['json']['templates'], str(
+                event_id) + "_" + name + ".json")
+            description_file = os.path.join(
+                config['event_description_root'],
+                str(event_id) + "_" + name + ".txt")
+
+            # Store template in JSON format and
+            # description in normal text format
+            store.put_many({template_file: json.dumps(template),
+                            description_file: description})
+            invalidate_content(template_file)
+            invalidate_content(description_file)
+
+            sql = statement("UPDATE `{events}` SET `template`=%s, "
+                            "`description`=%s WHERE `id`=%s;")
+            if insert(sql, (template_file, description_file, event_id)):
+                event = get_event(event_id)
+
+    if unit.failed:
         return {'Error': 'Unable to create event.'}
+    else:
+        return event
 
 
 def event_available(event_id, available):
@@ -333,11 +797,12 @@ def event_available(event_id, available):
     :return:
     """
     updated = datetime.datetime.now()
-    sql = "UPDATE {0} SET `available`='{1}', `updated`='{2}' " \
-          "WHERE `id`='{3}';".format(
-            tables['events'], available, updated, event_id)
+    sql = statement("UPDATE {events} SET `available`=%s, `updated`=%s, "
+                    "`version`=`version`+1, `changed`=%s WHERE `id`=%s;")
 
-    if insert(sql):
+    if insert(sql, (available, updated, datetime.datetime.utcnow(),
+                    event_id)):
+        invalidate_responses('events', "event:" + str(event_id))
         return get_event(event_id)
     else:
         return {'Error': 'Unable to change event availability.'}
@@ -354,32 +819,32 @@ def update_event(event_id, name, template, expire, description, available):
     :param available:
     :return:
     """
-    old_event = get_event(event_id)
-
-    # Get old event's template
-    with open(old_event['template'], "r") as t_read:
-        old_template = t_read
+    sql = statement("SELECT `template`, `description` FROM {events} "
+                    "WHERE `id`=%s;")
+    old_event = get_one(sql, (event_id,))
 
-    # Compare templates
-    if template != old_template:
-        with open(old_event['template'], "w") as file:
-            json.dump(template, file)
+    # Compare templates and descriptions
+    changed = {}
+    if template != get_template(old_event['template']):
+        changed[old_event['template']] = json.dumps(template)
 
-    # Get old event's description
-    with open(old_event['description'], "r") as d_read:
-        old_description = d_read.read()
+    if old_event['description'] is not None and \
+            description != get_description(old_event['description']):
+        changed[old_event['description']] = description
 
-    # Compare descriptions
-    if description != old_description:
-        with open(old_event['description'], "w") as d_file:
-            d_file.write(description)
+    if len(changed) > 0:
+        store.put_many(changed)
+        for key in changed:
+            invalidate_content(key)
 
     updated = datetime.datetime.now()
-    sql = "UPDATE `{0}` SET `name`='{1}', `updated`='{2}', " \
-          "`expire`='{3}', `available`='{4}' WHERE `id`='{5}';".format(
-        tables['events'], name, updated, expire, available, event_id)
+    sql = statement("UPDATE `{events}` SET `name`=%s, `updated`=%s, "
+                    "`expire`=%s, `available`=%s, `version`=`version`+1, "
+                    "`changed`=%s WHERE `id`=%s;")
 
-    if insert(sql):
+    if insert(sql, (name, updated, expire, available,
+                    datetime.datetime.utcnow(), event_id)):
+        invalidate_responses('events', "event:" + str(event_id))
         return {'id': event_id, 'name': name, 'template': template,
                 'description': description, 'updated': updated,
                 'expire': expire}
@@ -387,16 +852,76 @@ def update_event(event_id, name, template, expire, description, available):
         return {'Error': 'Unable to update event.'}
 
 
+def _get_content(path, parse=None):
+    """
+    Get content of blob, parsed with given function, from cache.
+    Blobs that have been modified since are read again.
+    :param path:
+    :param parse:
+    :return:
+    """
+    key = (path, store.version(path))
+
+    content = _content_cache.get(key)
+    if content is None:
+        content = store.get(path)
+        if parse is not None:
+            content = parse(content)
+        _content_cache.set(key, content)
+
+    return content
+
+
+def get_template(path):
+    """
+    Get parsed template of event. Returned template is shared,
+    so it must not be modified.
+    :param path:
+    :return:
+    """
+    return _get_content(path, json.loads)
+
+
+def get_description(path):
+    """
+    Get description of event.
+    :param path:
+    :return:
+    """
+    return _get_content(path)
+
+
+def invalidate_content(path):
+    """
+    Forget cached template or description.
+    :param path:
+    :return:
+    """
+    _content_cache.invalidate_where(lambda key: key[0] == path)
+
+
+def cache_stats():
+    """
+    Get hits and misses of caches of this worker.
+    :return:
+    """
+    stats = {'roles': _role_cache.stats(), 'content': _content_cache.stats(),
+             'identities': _identity_cache.stats()}
+    if responses is not None:
+        stats['responses'] = responses.stats()
+
+    return stats
+
+
 def get_image(event_id):
     """
     Get one image based on event_id.
     :param event_id:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `event_id`='{1}';".format(
-        tables['eventImages'], event_id)
+    sql = statement("SELECT * FROM {eventImages} WHERE `event_id`=%s;")
 
-    return get_one(sql)
+    return get_one(sql, (event_id,))
 
 
 def add_image(event_id, url):
@@ -406,10 +931,11 @@ def add_image(event_id, url):
     :param url:
     :return:
     """
-    sql = "INSERT INTO {0} (`event_id`, `image`) VALUES ('{1}', '{2}');"\
-        .format(tables["eventImages"], event_id, url)
+    sql = statement("INSERT INTO {eventImages} (`event_id`, `image`) "
+                    "VALUES (%s, %s);")
 
-    if insert(sql):
+    if insert(sql, (event_id, url)):
+        invalidate_responses('images')
         return get_image(event_id)
     else:
         return {'Error': "Unable to create image."}
@@ -423,10 +949,11 @@ def update_image(image_id, event_id, url):
     :param url:
     :return:
     """
-    sql = "UPDATE `{0}` SET `event_id`='{1}', `image`='{2}' WHERE `id`='{3}';"\
-        .format( tables["eventImages"], event_id, url, image_id)
+    sql = statement("UPDATE `{eventImages}` SET `event_id`=%s, `image`=%s "
+                    "WHERE `id`=%s;")
 
-    if insert(sql):
+    if insert(sql, (event_id, url, image_id)):
+        invalidate_responses('images')
         return get_image(event_id)
     else:
         return {'Error': "Unable to create image."}
@@ -434,32 +961,117 @@ def update_image(image_id, event_id, url):
 # Participants
 
 
-def get_participants(participant_id, fetchForm=False):
+def get_participants(participant_id, fetchForm=False, limit=None, after=0):
     """
-    Get one events participants based on event_id.
+    Get one events participants based on event_id, or at most limit
+    of them with participation_id after given.
+    Participants, their humans and roles are fetched with one query.
     :param participant_id:
     :param fetchForm:
+    :param limit:
+    :param after:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `event_id`={1};".format(
-        tables['eventParticipants'], participant_id)
+    params = (participant_id, after)
+    if limit is not None:
+        params += (limit,)
 
-    humans = []
-    connections = get_all(sql)
+    rows = get_all(_participants_sql(fetchForm, limit is not None), params)
 
-    # Convert participators to humans.
-    for connection in connections:
-        human = get_human(connection['human_id'])
-        human['paid'] = connection['paid']
-        human['participation_id'] = connection['id']
+    # Get forms for current event in one batch, if wanted
+    forms = _load_forms(rows) if fetchForm else [None] * len(rows)
+
+    return [_participant_human(row, form, fetchForm)
+            for row, form in zip(rows, forms)]
+
+
+def stream_participants(event_id, fetchForm=False, batch_size=500):
+    """
+    Yield participants of event as they come from the server, so the
+    whole list is never kept in memory. Forms are loaded a batch at a
+    time. Uses a connection of its own for as long as it is iterated.
+    :param event_id:
+    :param fetchForm:
+    :param batch_size:
+    :return:
+    """
+    db = pool.acquire()
+    cursor = db.cursor(SSDictCursor)
+    done = False
 
-        # Get form for current event, if wanted
-        if fetchForm:
-            human['form'] = get_json(connection['form'])
+    try:
+        cursor.execute(_participants_sql(fetchForm, False), (event_id, 0))
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            forms = _load_forms(rows) if fetchForm else [None] * len(rows)
+            for row, form in zip(rows, forms):
+                yield _participant_human(row, form, fetchForm)
+
+        cursor.close()
+        done = True
+    except MySQLError as e:
+        print(e, e.args)
+
+        # Response has already started, so it can only be cut short
+        raise
+    finally:
+
+        # Closing cursor of an abandoned or failed export would read
+        # all its remaining rows, so the connection is closed instead
+        pool.release(db, not done)
+
+
+def _participants_sql(fetchForm, page):
+    """
+    Get statement for participants of event, their humans and roles.
+    :param fetchForm:
+    :param page:
+    :return:
+    """
 
-        humans.append(human)
+    # Forms stored in database come with the same rows
+    form_data = ", p.`form_data`" if fetchForm else ""
+    page = " LIMIT %s" if page else ""
 
-    return humans
+    return statement(
+        "SELECT p.`id` AS `participation_id`, p.`paid`, p.`waitlisted`, "
+        "p.`form`" + form_data + ", h.`id`, h.`name`, h.`email`, "
+        "h.`signed`, r.`id` AS `role_id`, "
+        "r.`name` AS `role_name`, r.`power` AS `role_power` "
+        "FROM {eventParticipants} p "
+        "JOIN {humans} h ON h.`id`=p.`human_id` "
+        "LEFT JOIN {roles} r ON r.`id`=h.`role_id` "
+        "WHERE p.`event_id`=%s AND p.`id`>%s ORDER BY p.`id`" + page + ";")
+
+
+def _participant_human(row, form, fetchForm):
+    """
+    Convert row of participation to human.
+    :param row:
+    :param form:
+    :param fetchForm:
+    :return:
+    """
+    human = {'id': row['id'], 'name': row['name'], 'email': row['email'],
+             'signed': row['signed'], 'paid': row['paid'],
+             'waitlisted': row['waitlisted'],
+             'participation_id': row['participation_id']}
+
+    # Nest role like get_human does
+    if row['role_id'] is not None:
+        human['role'] = {'id': row['role_id'], 'name': row['role_name'],
+                         'power': row['role_power']}
+    else:
+        human['role'] = None
+
+    if fetchForm:
+        human['form'] = form
+
+    return human
 
 
 def get_participant(participant_id):
@@ -469,17 +1081,40 @@ def get_participant(participant_id):
     :return:
     """
 
-    sql = "SELECT * FROM {0} WHERE `id`='{1}';".format(
-        tables['eventParticipants'], participant_id)
+    sql = statement("SELECT * FROM {eventParticipants} WHERE `id`=%s;")
 
-    participant = get_one(sql)
+    participant = get_one(sql, (participant_id,))
 
     # Get form for participant
-    participant['form'] = get_json(participant['form'])
+    participant['form'] = _load_forms([participant])[0]
+    del participant['form_data']
 
     return participant
 
 
+def _load_forms(rows):
+    """
+    Get forms of participations in same order. Forms that are not stored
+    in database are read from store in one batch.
+    :param rows:
+    :return:
+    """
+    keys = [row['form'] for row in rows
+            if row.get('form_data') is None and row['form'] is not None]
+    blobs = store.get_many(keys) if len(keys) > 0 else {}
+
+    forms = []
+    for row in rows:
+        if row.get('form_data') is not None:
+            forms.append(json.loads(row['form_data']))
+        elif row['form'] in blobs:
+            forms.append(json.loads(blobs[row['form']]))
+        else:
+            forms.append(None)
+
+    return forms
+
+
 def add_participants(event_id, form):
     """
     Add human to participate in an event.
@@ -488,66 +1123,409 @@ def add_participants(event_id, form):
     :return:
     """
 
-    # Check if human with this email exists
-    # And create a new one, if doesn't
-    human = get_human(None, form['email'])
-    if human is None:
-        human = create_human(form['name'], form['email'])
-    else:
+    with transaction() as unit:
 
-        # Check if human is already in the event.
-        participants = get_participants(event_id)
-        for participant in participants:
-            if participant['id'] == human['id']:
+        # Check if human with this email exists
+        # And create a new one, if doesn't
+        human = get_human(None, form['email'])
+        if human is None:
+            human = create_human(form['name'], form['email'])
+        else:
+
+            # Check if human is already in the event.
+            sql = statement("SELECT `id` FROM {eventParticipants} "
+                            "WHERE `event_id`=%s AND `human_id`=%s;")
+            if get_one(sql, (event_id, human['id'])) is not None:
                 return {'Error': 'Already in event.'}
 
-    # If human is for some reason still not created
-    if human is None:
-        return {'Error': 'Human cannot be found.'}
-    elif 'Error' in human:
-        return human
+        # If human is for some reason still not created
+        if human is None:
+            return {'Error': 'Human cannot be found.'}
+        elif 'Error' in human:
+            return human
+
+        if form_storage == "database":
+            form_file = None
+            form_data = json.dumps(form)
+        else:
+
+            # Create file for form
+            event = get_event(event_id, False, True)
+            form_file = os.path.join(config['json']['form_root'], str(
+                event_id) + "_" + event['name'] + "/" + human['name'] +
+                ".json")
+            form_data = None
+
+            # Forms are stored by name of human, which has to be unique
+            sql = statement("SELECT `id` FROM {eventParticipants} "
+                            "WHERE `form`=%s;")
+            if get_one(sql, (form_file,)) is not None:
+                return {'Error': 'Form already exists.'}
+
+        # Claim a place from limit of human's role or from overflow.
+        # Counter is checked and bumped in one statement, so concurrent
+        # sign-ups can't take the same place.
+        role_id = human['role']['id'] if human['role'] is not None else None
+        limits = _candidate_limits(_event_limits(event_id), role_id)
+        limit_id = None
+        for limit in limits:
+            sql = statement("UPDATE `{limits}` SET `filled`=`filled`+1 "
+                            "WHERE `id`=%s AND (`size` IS NULL "
+                            "OR `filled`<`size`);")
+            if update(sql, (limit['id'],)):
+                limit_id = limit['id']
+                break
+
+        # Put human on waitlist if event is full
+        waitlisted = 1 if limit_id is None and len(limits) > 0 else 0
 
-    # Create file for form
-    form_file = os.path.join(config['json']['form_root'], str(event_id) + "_" + get_event(event_id)['name'] + "/" + human['name'] + ".json")
+        sql = statement("INSERT INTO {eventParticipants} (`event_id`, "
+                        "`human_id`, `form`, `form_data`, `paid`, "
+                        "`limit_id`, `waitlisted`) "
+                        "VALUES (%s, %s, %s, %s, 0, %s, %s);")
 
-    with open(form_file, "w") as file:
-        json.dump(form, file)
+        participation_id = insert_id(sql, (event_id, human['id'], form_file,
+                                           form_data, limit_id, waitlisted))
+        if participation_id is not None:
+            touch_events([event_id])
+            participant = get_participant(participation_id)
 
-    sql = "INSERT INTO {0} (`event_id`, `human_id`, `form`, `paid`) " \
-          "VALUES ('{1}', '{2}', '{3}', 0);".format(
-            tables['eventParticipants'], event_id, human['id'], form_file)
+            # Form of someone else is never overwritten by a sign-up
+            # that is rolled back
+            if form_file is not None:
+                blob = json.dumps(form)
+                after_commit(lambda: store.put(form_file, blob))
 
-    if insert(sql):
-        return get_participant(get_newest(tables['eventParticipants']))
+    if unit.failed:
+        return {'Error': 'Cannot add to event.'}
     else:
+        return participant
+
+
+def add_participants_bulk(event_id, forms, batch_size=500):
+    """
+    Add many humans to participate in an event at once. Humans are
+    created with one statement per batch and places are given in order
+    of forms. Returns result of each form in the same order.
+    :param event_id:
+    :param forms:
+    :param batch_size:
+    :return:
+    """
+    results = [None] * len(forms)
+    rows = {}
+    for i, form in enumerate(forms):
+        if not isinstance(form, dict) or \
+                not isinstance(form.get('name'), str) or \
+                not isinstance(form.get('email'), str) or \
+                form['email'].strip() == "":
+            results[i] = {'row': i, 'Error': 'Name and email are required.'}
+        elif normalize_email(form['email']) in rows:
+            results[i] = {'row': i, 'Error': 'Already in import.'}
+        else:
+            rows[normalize_email(form['email'])] = i
+
+    if len(rows) == 0:
+        return results
+
+    # Role with power 3 is used as a member role and
+    # role with power 1 is used as an 'other' role.
+    member = get_role_by_power(3)
+    other = get_role_by_power(1)
+    memberlist = config['json']['memberlist']
+    signed = datetime.datetime.now()
+
+    with transaction() as unit:
+        event = get_event(event_id, False, True)
+        if event is None:
+            return {'Error': 'Event cannot be found.'}
+
+        # Existing humans are left as they are
+        humans = []
+        for email, i in rows.items():
+            role = member if is_member(email, memberlist) else other
+            humans.append((forms[i]['name'], forms[i]['email'], signed,
+                           role['id'] if role is not None else 0))
+
+        # Only the fixed part goes through statement, so lengths of
+        # chunks don't pile up in its cache
+        prefix = statement("INSERT INTO {humans} (`name`, `email`, "
+                           "`signed`, `role_id`) VALUES ")
+        for start in range(0, len(humans), batch_size):
+            chunk = humans[start:start + batch_size]
+            sql = prefix + ", ".join(["(%s, %s, %s, %s)"] * len(chunk)) + \
+                " ON DUPLICATE KEY UPDATE `email`=`email`;"
+            insert(sql, [value for human in chunk for value in human])
+
+        sql = statement("SELECT `id`, `name`, `email`, `role_id` "
+                        "FROM {humans} WHERE `email` IN %s;")
+        found = {}
+        for start in range(0, len(humans), batch_size):
+            emails = [human[1] for human in humans[start:start + batch_size]]
+            for human in get_all(sql, (emails,)) or []:
+                found[normalize_email(human['email'])] = human
+
+        sql = statement("SELECT `human_id` FROM {eventParticipants} "
+                        "WHERE `event_id`=%s AND `human_id` IN %s;")
+        joined = set()
+        human_ids = [human['id'] for human in found.values()]
+        for start in range(0, len(human_ids), batch_size):
+            for participant in get_all(sql, (
+                    event_id, human_ids[start:start + batch_size])) or []:
+                joined.add(participant['human_id'])
+
+        # Forms are stored by name of human, which has to be unique
+        taken = set()
+        if form_storage != "database":
+            sql = statement("SELECT `form` FROM {eventParticipants} "
+                            "WHERE `event_id`=%s AND `form` IS NOT NULL;")
+            taken = set(participant['form']
+                        for participant in get_all(sql, (event_id,)) or [])
+
+        # Places are counted here while limits are locked
+        limits = _event_limits(event_id, True)
+        blobs = {}
+        participants = []
+        for email, i in sorted(rows.items(), key=lambda row: row[1]):
+            human = found.get(email)
+            if human is None:
+                results[i] = {'row': i, 'Error': 'Human cannot be found.'}
+                continue
+            elif human['id'] in joined:
+                results[i] = {'row': i, 'Error': 'Already in event.'}
+                continue
+
+            if form_storage == "database":
+                form_file = None
+                form_data = json.dumps(forms[i])
+            else:
+                form_file = os.path.join(
+                    config['json']['form_root'], str(event_id) + "_" +
+                    event['name'] + "/" + human['name'] + ".json")
+                form_data = None
+                if form_file in taken:
+                    results[i] = {'row': i, 'Error': 'Form already exists.'}
+                    continue
+
+                taken.add(form_file)
+                blobs[form_file] = json.dumps(forms[i])
+
+            limit = _pick_limit(limits, human['role_id'])
+            if limit is not None:
+                limit['filled'] += 1
+                limit_id = limit['id']
+                waitlisted = 0
+            else:
+                limit_id = None
+                waitlisted = 1 if len(_candidate_limits(
+                    limits, human['role_id'])) > 0 else 0
+
+            participants.append((event_id, human['id'], form_file,
+                                 form_data, 0, limit_id, waitlisted))
+            results[i] = {'row': i, 'human_id': human['id'],
+                          'email': human['email'], 'limit_id': limit_id,
+                          'waitlisted': waitlisted}
+
+        if len(participants) > 0:
+            if len(blobs) > 0:
+                store.put_many(blobs)
+
+            # Only placeholders in values let executemany send all rows
+            # in one statement
+            insert_many(statement("INSERT INTO {eventParticipants} "
+                                  "(`event_id`, `human_id`, `form`, "
+                                  "`form_data`, `paid`, `limit_id`, "
+                                  "`waitlisted`) "
+                                  "VALUES (%s, %s, %s, %s, %s, %s, %s);"),
+                        participants)
+
+            if len(limits) > 0:
+                insert_many(statement("UPDATE `{limits}` SET `filled`=%s "
+                                      "WHERE `id`=%s;"),
+                            [(limit['filled'], limit['id'])
+                             for limit in limits])
+
+            # Ids of new participations
+            sql = statement("SELECT `id`, `human_id` "
+                            "FROM {eventParticipants} "
+                            "WHERE `event_id`=%s AND `human_id` IN %s;")
+            added = {}
+            added_ids = [participant[1] for participant in participants]
+            for start in range(0, len(added_ids), batch_size):
+                for participant in get_all(sql, (
+                        event_id, added_ids[start:start + batch_size])) or []:
+                    added[participant['human_id']] = participant['id']
+
+            for result in results:
+                if 'human_id' in result:
+                    result['participation_id'] = added.get(result['human_id'])
+
+            touch_events([event_id])
+
+    if unit.failed:
         return {'Error': 'Cannot add to event.'}
+    else:
+        return results
 
 
-def delete_participants(event_id):
+def delete_participants(event_id, batch_size=500):
     """
     Delete old participants of event.
     :param event_id:
+    :param batch_size:
+    :return:
+    """
+    return _purge_participants([event_id], batch_size)
+
+
+def purge_expired_participants(days=30, batch_size=500):
+    """
+    Delete participants of events whose sign up has expired over
+    given days ago. Returns number of deleted participants.
+    :param days:
+    :param batch_size:
+    :return:
+    """
+    sql = statement("SELECT `id` FROM {events} "
+                    "WHERE `expire` < CURDATE() - INTERVAL %s DAY;")
+    events = get_all(sql, (days,))
+
+    if not events:
+        return 0
+
+    return _purge_participants([event['id'] for event in events],
+                               batch_size)
+
+
+def _purge_participants(event_ids, batch_size):
+    """
+    Delete participants of events in batches, one transaction each.
+    Only participants that have paid are deleted. Returns number of
+    deleted participants.
+    :param event_ids:
+    :param batch_size:
+    :return:
+    """
+    deleted = 0
+
+    while True:
+        with transaction() as unit:
+            sql = statement("SELECT `id`, `event_id`, `form`, `limit_id` "
+                            "FROM {eventParticipants} WHERE `event_id` IN %s "
+                            "AND `paid`>0 ORDER BY `id` LIMIT %s FOR UPDATE;")
+            participants = get_all(sql, (event_ids, batch_size))
+
+            if participants:
+                sql = statement("DELETE FROM {eventParticipants} "
+                                "WHERE `id` IN %s;")
+                insert(sql, ([participant['id']
+                              for participant in participants],))
+
+                # Give the places back to limits they were taken from
+                freed = {}
+                for participant in participants:
+                    if participant['limit_id'] is not None:
+                        freed[participant['limit_id']] = \
+                            freed.get(participant['limit_id'], 0) + 1
+
+                if len(freed) > 0:
+                    insert_many(statement("UPDATE `{limits}` SET "
+                                          "`filled`=`filled`-%s "
+                                          "WHERE `id`=%s;"),
+                                [(count, limit_id)
+                                 for limit_id, count in freed.items()])
+
+                # Only events that lost participants get a new version
+                touch_events(set(participant['event_id']
+                                 for participant in participants))
+
+        if unit.failed or participants is None:
+            print(' -- WARNING! Unable to delete participants of events:',
+                  event_ids, "--")
+            return deleted
+
+        # Forms are removed only after their records are gone
+        failed = store.delete_many([participant['form']
+                                    for participant in participants
+                                    if participant['form'] is not None])
+        for key in failed:
+            print(' -- WARNING! Unable to delete', key, "--")
+
+        deleted += len(participants)
+        if len(participants) < batch_size:
+            return deleted
+
+
+def migrate_forms(batch_size=500, remove_files=False):
+    """
+    Move forms from store to database in batches. With remove_files,
+    blobs are deleted after their forms are stored. Returns number of
+    moved forms.
+    :param batch_size:
+    :param remove_files:
     :return:
     """
-    participants = get_participants(event_id)
+    moved = 0
+    last_id = 0
 
-    # Delete participants if there is any
-    if len(participants) > 0:
+    while True:
+        sql = statement("SELECT `id`, `form` FROM {eventParticipants} "
+                        "WHERE `id`>%s AND `form_data` IS NULL "
+                        "AND `form` IS NOT NULL ORDER BY `id` LIMIT %s;")
+        participants = get_all(sql, (last_id, batch_size))
+
+        if participants is None:
+            print(' -- WARNING! Unable to read participants --')
+            return moved
+        elif len(participants) == 0:
+            return moved
+
+        last_id = participants[-1]['id']
+
+        blobs = store.get_many([participant['form']
+                                for participant in participants])
+        forms = []
         for participant in participants:
+            if participant['form'] in blobs:
+                forms.append((blobs[participant['form']], participant['id']))
+            else:
+                print(' -- WARNING! Unable to read', participant['form'],
+                      "--")
+
+        if remove_files:
+            sql = statement("UPDATE `{eventParticipants}` SET "
+                            "`form_data`=%s, `form`=NULL WHERE `id`=%s;")
+        else:
+            sql = statement("UPDATE `{eventParticipants}` SET "
+                            "`form_data`=%s WHERE `id`=%s;")
+
+        if len(forms) > 0 and not insert_many(sql, forms):
+            print(' -- WARNING! Unable to store forms --')
+            return moved
+
+        moved += len(forms)
 
-            # Delete participation record if participant has paid
-            if participant['paid'] is not None and participant['paid'] > 0:
-                try:
-                    os.remove(participant['form'])
-                except OSError:
-                    print(' -- WARNING! Unable to delete',
-                          participant['form'], "--")
-                sql = "DELETE FROM {0} WHERE `id`='{1}';"\
-                    .format(tables['eventParticipants'],
-                            participant['participantion_id'])
-                if not insert(sql):
-                    print(' -- WARNING! Unable to delete participant with ID:',
-                          participant['participantion_id'], "--")
+        if remove_files:
+            stored = set(participant_id for _, participant_id in forms)
+            failed = store.delete_many([participant['form']
+                                        for participant in participants
+                                        if participant['id'] in stored])
+            for key in failed:
+                print(' -- WARNING! Unable to delete', key, "--")
+
+
+def get_blob_keys():
+    """
+    Get keys of all templates, descriptions and forms in store.
+    :return:
+    """
+    sql = statement("SELECT `template` AS `key` FROM {events} "
+                    "UNION ALL SELECT `description` FROM {events} "
+                    "WHERE `description` IS NOT NULL "
+                    "UNION ALL SELECT `form` FROM {eventParticipants} "
+                    "WHERE `form` IS NOT NULL;")
+
+    return [row['key'] for row in get_all(sql)]
 
 
 def changePay(participation_id, status):
@@ -557,14 +1535,26 @@ def changePay(participation_id, status):
     :param status:
     :return:
     """
-    sql = "UPDATE `{0}` SET `paid`='{1}' WHERE `id`='{2}';".format(
-        tables['eventParticipants'], status, participation_id)
+    sql = statement("UPDATE `{eventParticipants}` SET `paid`=%s "
+                    "WHERE `id`=%s;")
 
-    if insert(sql):
-        return get_one("SELECT * FROM {0} WHERE `id`='{1}';".format(
-            tables['eventParticipants'], participation_id))
-    else:
+    with transaction() as unit:
+        if insert(sql, (status, participation_id)):
+
+            # Stored form data stays behind the form endpoints
+            participant = get_one(statement("SELECT `id`, `event_id`, "
+                                            "`human_id`, `form`, `paid`, "
+                                            "`waitlisted` FROM "
+                                            "{eventParticipants} "
+                                            "WHERE `id`=%s;"),
+                                  (participation_id,))
+            if participant is not None:
+                touch_events([participant['event_id']])
+
+    if unit.failed:
         return {'Error': 'Unable to change the status of payment'}
+    else:
+        return participant
 
 
 def get_my_events(human_id):
@@ -573,11 +1563,10 @@ def get_my_events(human_id):
     :param human_id:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `human_id`={1};".format(
-            tables['eventParticipants'], human_id)
+    sql = statement("SELECT * FROM {eventParticipants} WHERE `human_id`=%s;")
 
     events = []
-    connections = get_all(sql)
+    connections = get_all(sql, (human_id,))
     for connection in connections:
         events.append(get_event(connection['event_id']))
 
@@ -595,13 +1584,11 @@ def get_human(human_id, email=None):
     :return:
     """
     if human_id is None and email is not None:
-        sql = "SELECT * FROM {0} WHERE `email`='{1}';".format(
-            tables['humans'], email)
+        sql = statement("SELECT * FROM {humans} WHERE `email`=%s;")
+        human = get_one(sql, (email,))
     else:
-        sql = "SELECT * FROM {0} WHERE `id`={1};".format(
-            tables['humans'], human_id)
-
-    human = get_one(sql)
+        sql = statement("SELECT * FROM {humans} WHERE `id`=%s;")
+        human = get_one(sql, (human_id,))
 
     if human is not None:
 
@@ -619,48 +1606,27 @@ def create_human(name, email):
     :param email:
     :return:
     """
-    memberlist = config['json']['memberlist']
-    isMember = False
-
-    with open(memberlist, "r") as file:
-        data = json.load(file)
-
-    # Check if email exists in memberlist
-    for member in data:
-        for value in list(member.values()):
+    isMember = is_member(email, config['json']['memberlist'])
 
-            if value == email:
-                isMember = True
-                break
-
-    roles = get_roles()
+    # Assign role based on result of the memberlist check.
+    # Role with power 3 is used as a member role and
+    # role with power 1 is used as an 'other' role.
+    role = get_role_by_power(3 if isMember else 1)
+    role_id = role['id'] if role is not None else 0
 
-    # Assign role based on result of the memberlist check
-    if isMember:
-        role_id = 0
-        for role in roles:
-
-            # Role with power 3 is used as a member role.
-            if role['power'] == 3:
-                role_id = role['id']
-                break
-    else:
-        role_id = 0
-        for role in roles:
-
-            # Role with power 1 is used as an 'other' role.
-            if role['power'] == 1:
-                role_id = role['id']
-                break
+    with transaction() as unit:
+        sql = statement("INSERT INTO {humans} (`name`, `email`, `signed`, "
+                        "`role_id`) VALUES (%s, %s, %s, %s);")
 
-    sql = "INSERT INTO {0} (`name`, `email`, `signed`, `role_id`) " \
-          "VALUES ('{1}', '{2}', '{3}', '{4}');".format(
-            tables['humans'], name, email, datetime.datetime.now(), role_id)
+        human_id = insert_id(sql, (name, email, datetime.datetime.now(),
+                                   role_id))
+        if human_id is not None:
+            human = get_human(human_id)
 
-    if insert(sql):
-        return get_human(None, email)
-    else:
+    if unit.failed:
         return {'Error': 'Cannot create human.'}
+    else:
+        return human
 
 
 def update_human(human_id, name, email):
@@ -671,37 +1637,103 @@ def update_human(human_id, name, email):
     :param email:
     :return:
     """
-    sql = "UPDATE `{0}` SET `name`='{1}', `email`='{2}' WHERE `id`='{3}';"\
-        .format(tables['humans'], name, email, human_id)
+    with transaction() as unit:
+        sql = statement("UPDATE `{humans}` SET `name`=%s, `email`=%s "
+                        "WHERE `id`=%s;")
+        insert(sql, (name, email, human_id))
 
-    if insert(sql):
-        return get_human(human_id)
-    else:
+        # Participants of events show name and email of the human
+        sql = statement("SELECT DISTINCT `event_id` FROM {eventParticipants} "
+                        "WHERE `human_id`=%s;")
+        events = get_all(sql, (human_id,))
+        if events:
+            touch_events([event['event_id'] for event in events])
+
+    if unit.failed:
         return {'Error': 'Unable to update human.'}
+    else:
+        return get_human(human_id)
 
 
 # Roles
 
 
-def get_role(id):
+def _cached_roles(reload=False):
+    """
+    Get roles by id and by power from cache of this worker.
+    They are loaded from database on first use and after invalidation.
+    :param reload:
+    :return:
+    """
+    roles = None if reload else _role_cache.get('roles')
+
+    if roles is None:
+        sql = statement("SELECT * FROM {roles} ORDER BY `id`;")
+        rows = get_all(sql)
+        if rows is None:
+            return {'all': [], 'by_id': {}, 'by_power': {}}
+
+        roles = {'all': rows, 'by_id': {}, 'by_power': {}}
+        for role in rows:
+            roles['by_id'][role['id']] = role
+
+            # First role with each power is used, like before
+            roles['by_power'].setdefault(role['power'], role)
+
+        _role_cache.set('roles', roles)
+
+    return roles
+
+
+def invalidate_roles():
+    """
+    Forget cached roles of this worker.
+    :return:
+    """
+    _role_cache.invalidate()
+
+
+def get_role(id, reload=False):
     """
-    Get one role based on id.
+    Get one role based on id. With reload, role is read from database
+    in case another worker has changed it.
     :param id:
+    :param reload:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `id`={1};".format(tables['roles'], id)
+    try:
+        id = int(id)
+    except (TypeError, ValueError):
+        return None
 
-    return get_one(sql)
+    role = _cached_roles(reload)['by_id'].get(id)
+
+    # Role may have been created by another worker
+    if role is None and not reload:
+        role = _cached_roles(True)['by_id'].get(id)
 
+    return dict(role) if role is not None else None
 
-def get_roles():
+
+def get_role_by_power(power):
     """
-    Get all roles.
+    Get first role with given power.
+    :param power:
     :return:
     """
-    sql = "SELECT * FROM {0};".format(tables['roles'])
+    role = _cached_roles()['by_power'].get(power)
 
-    return get_all(sql)
+    return dict(role) if role is not None else None
+
+
+def get_roles(reload=False):
+    """
+    Get all roles. With reload, they are read from database in case
+    another worker has changed them.
+    :param reload:
+    :return:
+    """
+    return [dict(role) for role in _cached_roles(reload)['all']]
 
 
 def create_role(name, power):
@@ -711,11 +1743,13 @@ def create_role(name, power):
     :param power:
     :return:
     """
-    sql = "INSERT INTO {0} (`name`, `power`) VALUES ('{1}', '{2}');"\
-        .format(tables['roles'], name, power)
+    sql = statement("INSERT INTO {roles} (`name`, `power`) VALUES (%s, %s);")
 
-    if insert(sql):
-        return get_role(get_newest(tables['roles']))
+    role_id = insert_id(sql, (name, power))
+    if role_id is not None:
+        invalidate_roles()
+        invalidate_responses('roles')
+        return get_role(role_id)
     else:
         return {'Error': 'Unable to create role.'}
 
@@ -728,10 +1762,18 @@ def update_role(role_id, name, power):
     :param power:
     :return:
     """
-    sql = "UPDATE `{0}` SET `name`='{1}', `power`='{2}' WHERE `id`='{3}';"\
-        .format(tables['roles'], name, power, role_id)
+    sql = statement("UPDATE `{roles}` SET `name`=%s, `power`=%s "
+                    "WHERE `id`=%s;")
+
+    with transaction() as unit:
 
-    if insert(sql):
+        # Prices and limits of events show names of roles
+        if insert(sql, (name, power, role_id)):
+            touch_events()
+            invalidate_responses('roles')
+
+    if not unit.failed:
+        invalidate_roles()
         return get_role(role_id)
     else:
         return {'Error': 'Unable to update role.'}
@@ -747,17 +1789,18 @@ def get_price(event_id, role_id):
     :param role_id:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `event_id`={1} AND `role_id`={2};"\
-        .format(tables['prices'], event_id, role_id)
+    sql = statement("SELECT p.*, r.`name` AS `role_name`, "
+                    "r.`power` AS `role_power` FROM {prices} p "
+                    "LEFT JOIN {roles} r ON r.`id`=p.`role_id` "
+                    "WHERE p.`event_id`=%s AND p.`role_id`=%s;")
 
-    price = get_one(sql)
+    price = get_one(sql, (event_id, role_id))
 
     # Get simplified event for the price and role
     # Based on event_id and role_id
     price['event'] = get_event(price['event_id'], False, True)
     del price['event_id']
-    price['role'] = get_role(price['role_id'])
-    del price['role_id']
+    _joined_role(price)
 
     return price
 
@@ -768,20 +1811,38 @@ def get_prices(event_id):
     :param event_id:
     :return:
     """
-    sql = "SELECT * FROM {0} WHERE `event_id`={1};"\
-        .format(tables['prices'], event_id)
+    sql = statement("SELECT p.*, r.`name` AS `role_name`, "
+                    "r.`power` AS `role_power` FROM {prices} p "
+                    "LEFT JOIN {roles} r ON r.`id`=p.`role_id` "
+                    "WHERE p.`event_id`=%s;")
 
-    prices = get_all(sql)
+    prices = _remember(('prices', str(event_id)),
+                       lambda: get_all(sql, (event_id,)))
 
     for price in prices:
-
-        # Replace role_id with actual role
-        price['role'] = get_role(price['role_id'])
-        del price['role_id']
+        _joined_role(price)
 
     return prices
 
 
+def _joined_role(row):
+    """
+    Replace role_id and role columns joined to row with actual role.
+    Roles are read with the row, because cache of this worker may
+    not have changes made by others yet.
+    :param row:
+    :return:
+    """
+    if row['role_name'] is not None:
+        row['role'] = {'id': row['role_id'], 'name': row['role_name'],
+                       'power': row['role_power']}
+    else:
+        row['role'] = None
+    del row['role_id']
+    del row['role_name']
+    del row['role_power']
+
+
 def create_price(event_id, role_id, price):
     """
     Create price for event based on role.
@@ -790,11 +1851,14 @@ def create_price(event_id, role_id, price):
     :param price:
     :return:
     """
-    sql = "INSERT INTO {0} (`event_id`, `role_id`, `price`)" \
-          " VALUES ('{1}', '{2}', '{3}');".format(
-            tables['prices'], event_id, role_id, price)
+    sql = statement("INSERT INTO {prices} (`event_id`, `role_id`, `price`)"
+                    " VALUES (%s, %s, %s);")
 
-    if insert(sql):
+    with transaction() as unit:
+        if insert(sql, (event_id, role_id, price)):
+            touch_events([event_id])
+
+    if not unit.failed:
         return get_price(event_id, role_id)
     else:
         return {'Error': 'Could not create price.'}
@@ -809,11 +1873,14 @@ def update_price(price_id, event_id, role_id, price):
     :param price:
     :return:
     """
-    sql = "UPDATE `{0}` SET `event_id`='{1}', `role_id`='{2}', " \
-          "`price`='{3}' WHERE `id`='{4}';".format(
-            tables['prices'], event_id, role_id, price, price_id)
+    sql = statement("UPDATE `{prices}` SET `event_id`=%s, `role_id`=%s, "
+                    "`price`=%s WHERE `id`=%s;")
+
+    with transaction() as unit:
+        if insert(sql, (event_id, role_id, price, price_id)):
+            touch_events([event_id])
 
-    if insert(sql):
+    if not unit.failed:
         return get_price(event_id, role_id)
     else:
         return {'Error': 'Unable to update price.'}
@@ -821,100 +1888,178 @@ def update_price(price_id, event_id, role_id, price):
 
 def get_limits(event_id):
     """
-    Get participant limits for certain event. And calculate how many filled.
+    Get participant limits for certain event with how many are filled.
+    Filled sizes are kept up to date when participants are added or
+    deleted, repair_limits recalculates them if needed.
     :param event_id:
     :return:
     """
+    limits = _remember(('limits', str(event_id)),
+                       lambda: _event_limits(event_id))
+
+    # Participants that didn't fit in any limit
+    overflow = 0
+    waitlist = 0
+    if len(limits) > 0:
+        sql = statement("SELECT COUNT(*) AS `unplaced`, "
+                        "COALESCE(SUM(`waitlisted`), 0) AS `waitlist` "
+                        "FROM {eventParticipants} WHERE `event_id`=%s "
+                        "AND `limit_id` IS NULL;")
+        unplaced = _remember(('unplaced', str(event_id)),
+                             lambda: get_one(sql, (event_id,)))
+        waitlist = int(unplaced['waitlist'])
+        overflow = unplaced['unplaced'] - waitlist
 
-    # Get the limits from database.
-    sql = "SELECT * FROM {0} WHERE `event_id`={1};"\
-        .format(tables['limits'], event_id)
+    for limit in limits:
 
-    limits = get_all(sql)
+        # Replace role_id with actual role
+        if limit['role_id'] is not None:
+            limit['role'] = {'id': limit['role_id'],
+                             'name': limit['role_name'],
+                             'power': limit['role_power']}
+        else:
+            limit['role'] = None
+        del limit['role_id']
+        del limit['role_name']
+        del limit['role_power']
 
-    # Get needed objects for calculation of filled limits
-    roles = get_roles()
-    participants = get_participants(event_id)
-    overflow = []
+    # If some overflow exists, add it as a limit
+    if overflow > 0:
+        limits.append({'role': {'name': 'overflow'}, "size": overflow,
+                       "filled": overflow})
 
-    for role in roles:
-        role['participants'] = []
-        role['hasLimit'] = 0
+    # Same for participants waiting for a place
+    if waitlist > 0:
+        limits.append({'role': {'name': 'waitlist'}, "size": waitlist,
+                       "filled": waitlist})
 
-        # Gather participants with this role
-        for participant in participants:
-            if participant['role']['id'] == role['id']:
-                role['participants'].append(participant)
+    return limits
 
-        # Check if there is limit for role
-        for limit in limits:
-            if limit['role_id'] == role['id']:
-                role['hasLimit'] = limit['id']
-
-    # Fill limits for roles other than role with power 1
-    for role in roles:
-        if role['hasLimit'] > 0 and role['power'] != 1:
-            limit = get_limit(role['hasLimit'])
-            if len(role['participants']) <= limit['size']:
-                if not fill_limit(role['hasLimit'], len(role['participants'])):
-                    print(' -- WARNING! Unable to fill limit with ID:',
-                          role['hasLimit'], "--")
-            else:
-                used = role['participants'][:limit['size']]
-                delta = limit['size'] - len(role['participants'])
-                if not fill_limit(role['hasLimit'], len(used)):
-                    print(' -- WARNING! Unable to fill limit with ID:',
-                          role['hasLimit'], "--")
-                overflow = overflow + role['participants'][delta:]
-        elif role['power'] != 1:
-            overflow = overflow + role['participants']
-
-    # Search role with power 1 (Is used as role 'Other')
-    for role in roles:
-        if role['power'] == 1 and role['hasLimit'] > 0:
-            limit = get_limit(role['hasLimit'])
-
-            # Update database based on overflow
-            if len(overflow) > 0:
-                role['participants'] = role['participants'] + overflow
-
-                # Reset overflow
-                overflow = []
-
-                # Update filled size of limit to database
-                if len(role['participants']) <= limit['size']:
-                    if not fill_limit(role['hasLimit'],
-                                      len(role['participants'])):
-                        print(' -- WARNING! Unable to fill limit with ID:',
-                              role['hasLimit'], "--")
-                else:
-                    used = role['participants'][:limit['size']]
-                    delta = limit['size'] - len(role['participants'])
-                    if not fill_limit(role['hasLimit'], len(used)):
-                        print(' -- WARNING! Unable to fill limit with ID:',
-                              role['hasLimit'], "--")
-                    overflow = overflow + role['participants'][delta:]
-            else:
-                if len(role['participants']) <= limit['size']:
-                    if not fill_limit(role['hasLimit'],
-                                      len(role['participants'])):
-                        print(' -- WARNING! Unable to fill limit with ID:',
-                              role['hasLimit'], "--")
 
-    limits = get_all(sql)
+def _event_limits(event_id, lock=False):
+    """
+    Get limits of event with power of their roles.
+    With lock, rows are locked until end of transaction.
+    :param event_id:
+    :param lock:
+    :return:
+    """
+    if lock:
+        sql = statement(
+            "SELECT l.`id`, l.`event_id`, l.`size`, l.`filled`, "
+            "l.`role_id`, r.`name` AS `role_name`, r.`power` AS `role_power` "
+            "FROM {limits} l LEFT JOIN {roles} r ON r.`id`=l.`role_id` "
+            "WHERE l.`event_id`=%s ORDER BY l.`role_id`, l.`id` FOR UPDATE;")
+    else:
+        sql = statement(
+            "SELECT l.`id`, l.`event_id`, l.`size`, l.`filled`, "
+            "l.`role_id`, r.`name` AS `role_name`, r.`power` AS `role_power` "
+            "FROM {limits} l LEFT JOIN {roles} r ON r.`id`=l.`role_id` "
+            "WHERE l.`event_id`=%s ORDER BY l.`role_id`, l.`id`;")
+
+    return get_all(sql, (event_id,))
+
+
+def _candidate_limits(limits, role_id):
+    """
+    Get limits participant with role_id can take a place from, in order.
+    Participants that don't fit in their role's limit, or whose role has
+    no limit, overflow to the role with power 1 (Is used as role 'Other').
+    :param limits:
+    :param role_id:
+    :return:
+    """
+    candidates = []
 
     for limit in limits:
+        if limit['role_id'] == role_id and limit['role_power'] != 1:
+            candidates.append(limit)
+            break
 
-        # Replace role_id with actual role
-        limit['role'] = get_role(limit['role_id'])
-        del limit['role_id']
+    for limit in limits:
+        if limit['role_power'] == 1:
+            candidates.append(limit)
+            break
 
-    # If some overflow still exists (shouldn't), add it as a limit
-    if len(overflow) > 0:
-        limits.append({'role': {'name': 'overflow'}, "size": len(overflow),
-                       "filled": len(overflow)})
+    return candidates
 
-    return limits
+
+def _pick_limit(limits, role_id):
+    """
+    Choose limit with room that participant with role_id takes a place
+    from. Returns None if there is no room.
+    :param limits:
+    :param role_id:
+    :return:
+    """
+    for limit in _candidate_limits(limits, role_id):
+        if _has_room(limit):
+            return limit
+
+    return None
+
+
+def _has_room(limit):
+    """
+    Check if limit has room for one more.
+    :param limit:
+    :return:
+    """
+    return limit['size'] is None or (limit['filled'] or 0) < limit['size']
+
+
+def repair_limits(event_id):
+    """
+    Recalculate filled sizes of event's limits from its participants.
+    Participants without a place get one in order of sign up if there
+    is room.
+    :param event_id:
+    :return:
+    """
+    with transaction() as unit:
+        limits = _event_limits(event_id, True)
+        by_id = {}
+        for limit in limits:
+            limit['filled'] = 0
+            by_id[limit['id']] = limit
+
+        sql = statement("SELECT p.`id`, p.`limit_id`, h.`role_id` "
+                        "FROM {eventParticipants} p "
+                        "JOIN {humans} h ON h.`id`=p.`human_id` "
+                        "WHERE p.`event_id`=%s ORDER BY p.`id` FOR UPDATE;")
+        participants = get_all(sql, (event_id,))
+
+        # Keep places that are already taken
+        unplaced = []
+        for participant in participants:
+            limit = by_id.get(participant['limit_id'])
+            if limit is not None:
+                limit['filled'] += 1
+            else:
+                unplaced.append(participant)
+
+        # Place the rest in order of sign up if there is room
+        placed = []
+        for participant in unplaced:
+            limit = _pick_limit(limits, participant['role_id'])
+            if limit is not None:
+                limit['filled'] += 1
+                placed.append((limit['id'], 0, participant['id']))
+            elif participant['limit_id'] is not None:
+                placed.append((None, 1, participant['id']))
+
+        if len(placed) > 0:
+            insert_many(statement("UPDATE `{eventParticipants}` SET "
+                                  "`limit_id`=%s, `waitlisted`=%s "
+                                  "WHERE `id`=%s;"), placed)
+        if len(limits) > 0:
+            insert_many(statement("UPDATE `{limits}` SET `filled`=%s "
+                                  "WHERE `id`=%s;"),
+                        [(limit['filled'], limit['id']) for limit in limits])
+
+        touch_events([event_id])
+
+    return not unit.failed
 
 
 def get_limit(first_id, second_id=None):
@@ -926,13 +2071,12 @@ def get_limit(first_id, second_id=None):
     :return:
     """
     if second_id is None:
-        sql = "SELECT * FROM {0} WHERE `id`={1};"\
-            .format(tables['limits'], first_id)
+        sql = statement("SELECT * FROM {limits} WHERE `id`=%s;")
+        limit = get_one(sql, (first_id,))
     else:
-        sql = "SELECT * FROM {0} WHERE `event_id`={1} AND `role_id`={2};"\
-            .format(tables['limits'], first_id, second_id)
-
-    limit = get_one(sql)
+        sql = statement("SELECT * FROM {limits} WHERE `event_id`=%s "
+                        "AND `role_id`=%s;")
+        limit = get_one(sql, (first_id, second_id))
 
     # Replace event_id and role_id with actual event and role
     limit['event'] = get_event(limit['event_id'], False, True)
@@ -951,18 +2095,20 @@ def create_limit(event_id, size, role_id=None):
     :param role_id:
     :return:
     """
-    if role_id is None:
-        sql = "INSERT INTO {0} (`event_id`, `size`) VALUES ('{1}', '{2}');"\
-            .format(tables['limits'], event_id, size)
-    else:
-        sql = "INSERT INTO {0} (`event_id`, `role_id`, `size`) " \
-              "VALUES ('{1}', '{2}', '{3}');".format(
-                tables['limits'], event_id, role_id, size)
+    sql = statement("INSERT INTO {limits} (`event_id`, `role_id`, `size`, "
+                    "`filled`) VALUES (%s, %s, %s, 0);")
 
-    if insert(sql):
-        return get_limit(get_newest(tables['limits']))
-    else:
+    with transaction() as unit:
+
+        # Existing participants take their places from new limit
+        limit_id = insert_id(sql, (event_id, role_id, size))
+        if limit_id is not None:
+            repair_limits(event_id)
+
+    if unit.failed:
         return {'Error': 'Unable to create limit.'}
+    else:
+        return get_limit(limit_id)
 
 
 def update_limit(limit_id, event_id, size, role_id=None):
@@ -975,28 +2121,21 @@ def update_limit(limit_id, event_id, size, role_id=None):
     :return:
     """
     if role_id is None:
-        sql = "UPDATE `{0}` SET `event_id`='{1}', `size`='{2}' " \
-              "WHERE `id`='{3}';".format(
-                tables['limits'], event_id, size, limit_id)
+        sql = statement("UPDATE `{limits}` SET `event_id`=%s, `size`=%s "
+                        "WHERE `id`=%s;")
+        params = (event_id, size, limit_id)
     else:
-        sql = "UPDATE `{0}` SET `event_id`='{1}', `role_id`='{2}', " \
-              "`size`='{3}' WHERE `id`='{4}';".format(
-                tables['limits'], event_id, role_id, size, limit_id)
-
-    if insert(sql):
-        return get_limit(limit_id)
-    else:
-        return {'Error': 'Unable to update limit.'}
+        sql = statement("UPDATE `{limits}` SET `event_id`=%s, `role_id`=%s, "
+                        "`size`=%s WHERE `id`=%s;")
+        params = (event_id, role_id, size, limit_id)
 
+    with transaction() as unit:
 
-def fill_limit(limit_id, filled):
-    """
-    Fill limit when checked.
-    :param limit_id:
-    :param filled:
-    :return:
-    """
-    sql = "UPDATE `{0}` SET `filled`='{1}' WHERE `id`='{2}';"\
-        .format(tables['limits'], filled, limit_id)
+        # Changed size can make room for participants in overflow
+        if insert(sql, params):
+            repair_limits(event_id)
 
-    return insert(sql)
+    if unit.failed:
+        return {'Error': 'Unable to update limit.'}
+    else:
+        return get_limit(limit_id)
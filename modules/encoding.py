@@ -0,0 +1,196 @@
+import datetime
+import decimal
+import json
+import uuid
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask.json.provider import JSONProvider
+except ImportError:
+    JSONProvider = None
+
+
+# Names used in HTTP dates, independent of locale.
+_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep",
+           "Oct", "Nov", "Dec")
+
+
+@lru_cache(maxsize=4096)
+def _http_date(value):
+    """
+    Format date or datetime like HTTP headers, as Flask always has.
+    Naive datetimes are taken as UTC. Lists repeat the same dates a lot,
+    so formatted ones are cached.
+    :param value:
+    :return:
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour, minute, second = 0, 0, 0
+
+    return "{0}, {1:02d} {2} {3:04d} {4:02d}:{5:02d}:{6:02d} GMT".format(
+        _DAYS[value.weekday()], value.day, _MONTHS[value.month - 1],
+        value.year, hour, minute, second)
+
+
+def _default_value(value):
+    """
+    Convert values other than dates that JSON doesn't know.
+    :param value:
+    :return:
+    """
+    if isinstance(value, decimal.Decimal):
+
+        # Sums and averages from MySQL come as decimals
+        if value == value.to_integral_value():
+            return int(value)
+        return float(value)
+    elif isinstance(value, uuid.UUID):
+        return str(value)
+    elif hasattr(value, '__html__'):
+        return str(value.__html__())
+
+    raise TypeError("Object of type " + type(value).__name__ +
+                    " is not JSON serializable")
+
+
+def _default_http(value):
+    """
+    Convert value JSON doesn't know, dates as in HTTP headers.
+    :param value:
+    :return:
+    """
+    if isinstance(value, datetime.date):
+        return _http_date(value)
+    return _default_value(value)
+
+
+def _default_iso(value):
+    """
+    Convert value JSON doesn't know, dates in ISO 8601.
+    :param value:
+    :return:
+    """
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return _default_value(value)
+
+
+def dumps(obj, compact=True, sort_keys=False, dates="http", fast=True):
+    """
+    Encode obj as UTF-8 JSON. Uses orjson when it is installed and
+    fast is True, otherwise the standard library. Dates are written
+    as in HTTP headers or, with dates "iso", in ISO 8601.
+    :param obj:
+    :param compact:
+    :param sort_keys:
+    :param dates:
+    :param fast:
+    :return:
+    """
+    default = _default_iso if dates == "iso" else _default_http
+
+    if fast and orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if dates != "iso":
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if not compact:
+            option |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(obj, default=default, option=option)
+
+    if compact:
+        separators, indent = (",", ":"), None
+    else:
+        separators, indent = (",", ": "), 2
+
+    return json.dumps(obj, default=default, ensure_ascii=False,
+                      separators=separators, indent=indent,
+                      sort_keys=sort_keys).encode("utf-8")
+
+
+def loads(data):
+    """
+    Decode JSON from text or bytes.
+    :param data:
+    :return:
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+class Encoder(json.JSONEncoder):
+    """
+    Encoder for Flask versions without JSON providers.
+    """
+
+    dates = "http"
+
+    def default(self, o):
+        if self.dates == "iso":
+            return _default_iso(o)
+        return _default_http(o)
+
+
+if JSONProvider is not None:
+
+    class FastJSONProvider(JSONProvider):
+        """
+        JSON provider writing responses with dumps.
+        """
+
+        compact = True
+        sort_keys = False
+        dates = "http"
+
+        def dumps(self, obj, **kwargs):
+            return dumps(obj, self.compact, self.sort_keys,
+                         self.dates).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(
+                dumps(obj, self.compact, self.sort_keys, self.dates),
+                mimetype="application/json")
+
+
+def install(app, settings):
+    """
+    Make jsonify of app use these encoders, based on encoding block
+    of config.
+    :param app:
+    :param settings:
+    :return:
+    """
+    dates = settings.get('dates', "http")
+
+    if JSONProvider is None:
+
+        # Older Flask can only change how unknown values are encoded
+        Encoder.dates = dates
+        app.json_encoder = Encoder
+        app.config['JSONIFY_PRETTYPRINT_REGULAR'] = \
+            not settings.get('compact', True)
+        return
+
+    provider = FastJSONProvider(app)
+    provider.compact = settings.get('compact', True)
+    provider.sort_keys = settings.get('sort_keys', False)
+    provider.dates = dates
+    app.json = provider
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from collections import deque
+import pymysql
+from pymysql import MySQLError
+
+
+class PoolTimeout(MySQLError):
+    """
+    Raised when no connection could be checked out in time.
+    """
+
+
+class ConnectionPool:
+    """
+    Pool of MySQL connections owned by one worker process.
+
+    uWSGI forks workers after the application is imported, so the pool
+    keeps track of the process it was filled in and starts over with
+    fresh sockets when it finds itself in a new one.
+    """
+
+    def __init__(self, settings):
+        """
+        Create pool based on the database block of config.
+        :param settings:
+        """
+        self.settings = settings
+        self.size = int(settings.get('pool_size', 5))
+        self.timeout = float(settings.get('pool_timeout', 10))
+        self.recycle = float(settings.get('pool_recycle', 3600))
+        self.ping = bool(settings.get('pool_ping', True))
+
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._created = {}
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(self.size)
+
+    def _connect(self):
+        """
+        Open new connection to database.
+        :return:
+        """
+        connection = pymysql.connect(
+            host=self.settings['host'],
+            user=self.settings['username'],
+            password=self.settings['password'],
+            database=self.settings['database'],
+            port=int(self.settings.get('port', 3306)),
+            connect_timeout=int(self.settings.get('connect_timeout', 10)),
+            autocommit=True,
+            cursorclass=pymysql.cursors.DictCursor)
+
+        self._created[id(connection)] = time.monotonic()
+        return connection
+
+    def _discard(self, connection):
+        """
+        Close connection and forget it.
+        :param connection:
+        :return:
+        """
+        self._created.pop(id(connection), None)
+        try:
+            connection.close()
+        except MySQLError:
+            pass
+
+    def _check_fork(self):
+        """
+        Drop connections inherited from the parent process.
+        :return:
+        """
+        if self._pid != os.getpid():
+
+            # Sockets belong to the parent, so never close them from here.
+            self._pid = os.getpid()
+            self._idle = deque()
+            self._created = {}
+            self._lock = threading.Lock()
+            self._available = threading.Semaphore(self.size)
+
+    def _expired(self, connection):
+        """
+        Check if connection has outlived pool_recycle.
+        :param connection:
+        :return:
+        """
+        created = self._created.get(id(connection))
+        return created is None or \
+            self.recycle > 0 and time.monotonic() - created > self.recycle
+
+    def acquire(self):
+        """
+        Check out connection from pool, opening a new one if needed.
+        :return:
+        """
+        self._check_fork()
+
+        if not self._available.acquire(timeout=self.timeout):
+            raise PoolTimeout('No database connection available.')
+
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+
+                if connection is None:
+                    return self._connect()
+
+                # Replace connections that are too old
+                if self._expired(connection):
+                    self._discard(connection)
+                    continue
+
+                # Health check, reconnects stale sockets in place
+                if self.ping:
+                    try:
+                        connection.ping(reconnect=True)
+                    except MySQLError:
+                        self._discard(connection)
+                        continue
+
+                return connection
+        except BaseException:
+            self._available.release()
+            raise
+
+    def release(self, connection, broken=False):
+        """
+        Return connection to pool.
+        :param connection:
+        :param broken:
+        :return:
+        """
+        if self._pid != os.getpid():
+            return
+
+        try:
+            if broken or self._expired(connection) or not connection.open:
+                self._discard(connection)
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._available.release()
+
+    def close(self):
+        """
+        Close all idle connections.
+        :return:
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+
+        for connection in idle:
+            self._discard(connection)
@@ -0,0 +1,234 @@
+import os
+import sqlite3
+import threading
+
+
+class BlobStore:
+    """
+    Storage of templates, descriptions and forms as text blobs.
+    Keys are the locations stored in database. Backends implement the
+    batched operations, single operations are built on them.
+    """
+
+    def get_many(self, keys):
+        """
+        Get blobs of keys as a dict. Missing keys are left out.
+        :param keys:
+        :return:
+        """
+        raise NotImplementedError
+
+    def put_many(self, items):
+        """
+        Store blobs from a dict of keys and blobs.
+        :param items:
+        :return:
+        """
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """
+        Delete blobs of keys. Returns keys that could not be deleted.
+        :param keys:
+        :return:
+        """
+        raise NotImplementedError
+
+    def version(self, key):
+        """
+        Get token that changes whenever blob of key changes,
+        None if it doesn't exist.
+        :param key:
+        :return:
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """
+        Get blob of key. Raises KeyError if it doesn't exist.
+        :param key:
+        :return:
+        """
+        return self.get_many([key])[key]
+
+    def put(self, key, data):
+        """
+        Store blob of key.
+        :param key:
+        :param data:
+        :return:
+        """
+        self.put_many({key: data})
+
+    def delete(self, key):
+        """
+        Delete blob of key. Returns False if it could not be deleted.
+        :param key:
+        :return:
+        """
+        return len(self.delete_many([key])) == 0
+
+
+class FileStore(BlobStore):
+    """
+    One file per blob, key is the path of the file.
+    """
+
+    def get_many(self, keys):
+        blobs = {}
+        for key in keys:
+            try:
+                with open(key, "r") as file:
+                    blobs[key] = file.read()
+            except FileNotFoundError:
+                pass
+
+        return blobs
+
+    def put_many(self, items):
+        for key, data in items.items():
+            directory = os.path.dirname(key)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            with open(key, "w") as file:
+                file.write(data)
+
+    def delete_many(self, keys):
+        failed = []
+        for key in keys:
+            try:
+                os.remove(key)
+            except OSError:
+                failed.append(key)
+
+        return failed
+
+    def version(self, key):
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+
+class SQLiteStore(BlobStore):
+    """
+    All blobs in one indexed SQLite file.
+    """
+
+    def __init__(self, path):
+        """
+        Open or create store in path.
+        :param path:
+        """
+        self.path = path
+        self._local = threading.local()
+
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS blobs ("
+                       "key TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                       "version INTEGER NOT NULL DEFAULT 1)")
+
+    def _connection(self):
+        """
+        Get connection of current thread and process.
+        :return:
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+
+        return db
+
+    def get_many(self, keys):
+        keys = list(keys)
+        blobs = {}
+
+        # SQLite limits number of parameters of one statement
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self._connection().execute(
+                "SELECT key, data FROM blobs WHERE key IN ({0})".format(
+                    ", ".join("?" * len(chunk))), chunk)
+            blobs.update(rows)
+
+        return blobs
+
+    def put_many(self, items):
+        with self._connection() as db:
+            db.executemany("INSERT INTO blobs (key, data) VALUES (?, ?) "
+                           "ON CONFLICT (key) DO UPDATE SET "
+                           "data=excluded.data, version=version+1",
+                           list(items.items()))
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        with self._connection() as db:
+            db.executemany("DELETE FROM blobs WHERE key=?",
+                           [(key,) for key in keys])
+
+        return []
+
+    def version(self, key):
+        row = self._connection().execute(
+            "SELECT version FROM blobs WHERE key=?", (key,)).fetchone()
+
+        return row[0] if row is not None else None
+
+
+class MemoryStore(BlobStore):
+    """
+    Blobs in memory of one process, for tests.
+    """
+
+    def __init__(self):
+        self._blobs = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._blobs[key] for key in keys
+                    if key in self._blobs}
+
+    def put_many(self, items):
+        with self._lock:
+            for key, data in items.items():
+                self._blobs[key] = data
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._blobs.pop(key, None)
+
+        return []
+
+    def version(self, key):
+        with self._lock:
+            if key not in self._blobs:
+                return None
+            return self._versions[key]
+
+
+def create_store(settings):
+    """
+    Create blob store based on storage block of config.
+    :param settings:
+    :return:
+    """
+    backend = settings.get('backend', 'files')
+
+    if backend == 'files':
+        return FileStore()
+    elif backend == 'sqlite':
+        return SQLiteStore(settings['path'])
+    elif backend == 'memory':
+        return MemoryStore()
+
+    raise ValueError("Unknown storage backend: " + backend)
@@ -1,17 +1,34 @@
 import json
+import os
 import random
 import string
+import threading
+from .config import Config, ConfigError, reload_on_sighup
+
+# Config of the process, see get_config.
+_config = None
+_config_lock = threading.Lock()
+
+# Emails found in memberlist and (path, mtime, size) they were read from.
+_members = {'stat': None, 'emails': frozenset()}
+_members_lock = threading.Lock()
 
 
 def get_config():
     """
-    Read config
+    Get config of the process. It is read from config/config.json once
+    and reloaded when the file changes.
     :return:
     """
-    with open("config/config.json", "r") as conf:
-        data = json.load(conf)
+    global _config
 
-    return data
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = Config()
+                reload_on_sighup(_config)
+
+    return _config
 
 
 def get_secret():
@@ -19,10 +36,7 @@ def get_secret():
     Get secret from config.
     :return:
     """
-    with open("config/config.json", "r") as conf:
-        data = json.load(conf)
-
-    return data['secret']
+    return get_config().secret
 
 
 def update_config(keys, values):
@@ -37,14 +51,12 @@ def update_config(keys, values):
     if len(keys) != len(values):
         return False
 
-    # Update config
-    data = get_config()
-    for i in range(len(keys)):
-        data[keys[i]] = values[i]
-
     # Save config file
-    with open("config/config.json", "w") as conf:
-        json.dump(data, conf)
+    try:
+        get_config().update(dict(zip(keys, values)))
+    except (OSError, ConfigError) as e:
+        print(' -- WARNING! Unable to update config', e, "--")
+        return False
 
     return True
 
@@ -89,11 +101,107 @@ def check_extension(filename):
     :param filename:
     :return:
     """
-    extensions = set(get_config()['file_extensions'])
+    extensions = set(get_config().file_extensions)
 
     return '.' in filename and filename.rsplit(".", 1)[1].lower() in extensions
 
 
+def normalize_email(email):
+    """
+    Normalize email for comparison.
+    :param email:
+    :return:
+    """
+    return email.strip().lower()
+
+
+def _member_emails(path):
+    """
+    Get emails of memberlist as a set. File is parsed again only
+    when its modification time or size changes.
+    :param path:
+    :return:
+    """
+    try:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+    except OSError as e:
+        print(' -- WARNING! Unable to read memberlist', path, e, "--")
+        return _members['emails']
+
+    if _members['stat'] == key:
+        return _members['emails']
+
+    with _members_lock:
+
+        # Another thread may have loaded it already
+        if _members['stat'] != key:
+            emails = set()
+            for member in get_json(path):
+                for value in member.values():
+                    if isinstance(value, str) and '@' in value:
+                        emails.add(normalize_email(value))
+
+            _members['emails'] = frozenset(emails)
+            _members['stat'] = key
+
+    return _members['emails']
+
+
+def is_member(email, memberlist):
+    """
+    Check if email is found in memberlist.
+    :param email:
+    :param memberlist:
+    :return:
+    """
+    return normalize_email(email) in _member_emails(memberlist)
+
+
+def template_fields(template):
+    """
+    Get names of fields of event template in order. Template is a list
+    of fields, or an object with one in 'fields', and fields are names
+    or objects with a name. Object without such list is taken as
+    fields by keys.
+    :param template:
+    :return:
+    """
+    if isinstance(template, dict):
+        for key in ('fields', 'form', 'questions'):
+            if isinstance(template.get(key), list):
+                return template_fields(template[key])
+
+        return list(template.keys())
+
+    names = []
+    if isinstance(template, list):
+        for field in template:
+            if isinstance(field, dict):
+                field = field.get('name', field.get('id', field.get('key')))
+
+            if isinstance(field, str) and field not in names:
+                names.append(field)
+
+    return names
+
+
+def flatten_value(value):
+    """
+    Convert value of form to text of one cell.
+    :param value:
+    :return:
+    """
+    if value is None:
+        return ""
+    elif isinstance(value, list):
+        return "; ".join(flatten_value(item) for item in value)
+    elif isinstance(value, dict):
+        return json.dumps(value)
+
+    return str(value)
+
+
 # Work around for working with Flask-JWT.
 class User:
     def __init__(self, user_id, username, access_token):